@@ -1,10 +1,10 @@
 """
 API routes for the RAG server.
 """
+import asyncio
 import logging
 import re
 import json
-import requests
 from datetime import datetime
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
 from fastapi.responses import StreamingResponse
@@ -26,19 +26,26 @@ from ..models.api_models import (
 )
 from ..services.pdf_service import PDFService
 from ..services.vector_store_service import VectorStoreService
-from ..utils.llm_client import call_llm, create_semantic_query, build_prompt, build_rag_prompt
+from ..utils.llm_client import (
+    call_llm, call_llm_stream, create_semantic_query, build_prompt, build_rag_prompt,
+    set_semantic_query_encoder, CHAT_SYSTEM_PROMPT
+)
 from ..utils.text_processing import extract_arxiv_id
-from ..config import DEFAULT_SEARCH_K
+from ..config import DEFAULT_SEARCH_K, AGENT_MAX_HISTORY_TURNS
 from ..services.db import get_db
 from ..services.chat_summary_service import ChatSummaryService
-from ..services.agent_service import AgentService
+from ..services.agent_service import AgentService, get_agent_service
 
 logger = logging.getLogger(__name__)
 
 # Initialize services
 pdf_service = PDFService()
 vector_store = VectorStoreService()
-agent_service = AgentService(vector_store=vector_store)
+set_semantic_query_encoder(vector_store.embed_texts)
+
+def get_agent() -> AgentService:
+    """Dependency returning the lazily created agent service."""
+    return get_agent_service(vector_store)
 
 # Create router
 router = APIRouter()
@@ -74,8 +81,8 @@ async def ingest_paper(req: PaperIngestRequest):
             logger.info(f"Extracted arXiv ID: {arxiv_id}")
             
             try:
-                # Download and extract text
-                text = pdf_service.download_arxiv_pdf_text(arxiv_id)
+                # Download and extract text in a worker thread so the event loop stays free
+                text = await asyncio.to_thread(pdf_service.download_arxiv_pdf_text, arxiv_id)
 
                 # Fetch arXiv metadata
                 client = arxiv.Client()
@@ -113,12 +120,12 @@ async def ingest_paper(req: PaperIngestRequest):
             
         else:
             # Generic URL download
-            pdf_path = pdf_service.download_paper(input_str)
+            pdf_path = await asyncio.to_thread(pdf_service.download_paper, input_str)
             if not pdf_path:
                 raise HTTPException(status_code=400, detail="Failed to download paper")
             
             # Extract text from downloaded PDF
-            text = pdf_service.extract_text_from_pdf(pdf_path)
+            text = await asyncio.to_thread(pdf_service.extract_text_from_pdf, pdf_path)
             if not text:
                 raise HTTPException(status_code=400, detail="Failed to extract text from PDF")
             
@@ -153,7 +160,7 @@ async def search(req: SearchRequest):
     """Search for similar texts in the vector store."""
     try:
         # Create a semantic query using LLM before embedding
-        semantic_query = create_semantic_query(req.query)
+        semantic_query = await create_semantic_query(req.query)
         logger.info(f"Original query: {req.query}")
         logger.info(f"Semantic query: {semantic_query}")
         
@@ -170,7 +177,7 @@ async def search(req: SearchRequest):
 async def search_fine_chunks(req: SearchRequest):
     """Search for similar texts in the fine chunks collection (for citation suggestion)."""
     try:
-        semantic_query = create_semantic_query(req.query)
+        semantic_query = await create_semantic_query(req.query)
         logger.info(f"Fine search query: {semantic_query}")
         
         results = vector_store.search_collection(semantic_query, req.k, "fine")
@@ -185,7 +192,7 @@ async def search_fine_chunks(req: SearchRequest):
 async def search_coarse_chunks(req: SearchRequest):
     """Search for similar texts in the coarse chunks collection (for question answering)."""
     try:
-        semantic_query = create_semantic_query(req.query)
+        semantic_query = await create_semantic_query(req.query)
         logger.info(f"Coarse search query: {semantic_query}")
         
         results = vector_store.search_collection(semantic_query, req.k, "coarse")
@@ -292,7 +299,7 @@ async def chat(req: ChatRequest):
         # If this is the first message in chat, include RAG context
         if not req.chat_history:
             # Search for relevant context
-            semantic_query = create_semantic_query(req.query)
+            semantic_query = await create_semantic_query(req.query)
             search_results = vector_store.search(semantic_query, DEFAULT_SEARCH_K)
             
             if search_results["results"]:
@@ -308,11 +315,10 @@ async def chat(req: ChatRequest):
         history = [{"user": turn.user, "assistant": turn.assistant} for turn in req.chat_history]
         
         # Build the prompt
-        system_message = "You are a helpful research assistant. Use the provided context to answer questions accurately and comprehensively."
-        prompt = build_prompt(system_message, context, history, req.query)
+        prompt = build_prompt(CHAT_SYSTEM_PROMPT, context, history, req.query)
         
         # Get response from LLM
-        response = call_llm(prompt)
+        response = await call_llm(prompt)
         
         return ChatResponse(answer=response)
         
@@ -330,7 +336,7 @@ async def chat_stream(req: ChatRequest):
         logger.info(f"Chat ID: {req.chat_id}")
         
         # Search for relevant context using coarse chunks for question answering
-        semantic_query = create_semantic_query(req.query)
+        semantic_query = await create_semantic_query(req.query)
         search_results = vector_store.search_collection(semantic_query, DEFAULT_SEARCH_K, "coarse")
         
         # Build context
@@ -344,45 +350,22 @@ async def chat_stream(req: ChatRequest):
         history = [{"user": turn.user, "assistant": turn.assistant} for turn in req.chat_history]
         
         # Build the prompt
-        system_message = "You are a helpful research assistant. Use the provided context to answer questions accurately and comprehensively."
-        prompt = build_prompt(system_message, context, history, req.query)
+        prompt = build_prompt(CHAT_SYSTEM_PROMPT, context, history, req.query)
         
-        def event_stream():
+        async def event_stream():
             # Always yield chat_id as the first event
             if req.chat_id:
                 yield f"data: {json.dumps({'chat_id': req.chat_id})}\n\n"
             
-            # Stream the LLM response
-            response = requests.post(
-                "http://100.115.151.29:8080/completion",
-                json={
-                    "prompt": prompt,
-                    "temperature": 0.7,
-                    "n_predict": 300,
-                    "stream": True,
-                    "stop": ["\nUser:", "\nAssistant:"]
-                },
-                stream=True
-            )
-
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        line_str = line.decode('utf-8')
-                        if line_str.startswith('data: '):
-                            json_str = line_str[6:]
-                            chunk = json.loads(json_str)
-                            content = chunk.get("content", "")
-                            done = chunk.get("stop", False)
-                            yield f"data: {json.dumps({'content': content, 'done': done})}\n\n"
-                        else:
-                            chunk = json.loads(line_str)
-                            content = chunk.get("content", "")
-                            done = chunk.get("stop", False)
-                            yield f"data: {json.dumps({'content': content, 'done': done})}\n\n"
-                    except Exception as e:
-                        error_data = json.dumps({'error': str(e), 'done': True})
-                        yield f"data: {error_data}\n\n"
+            # Stream the LLM response token by token
+            try:
+                async for content in call_llm_stream(prompt, temperature=0.7, n_predict=300):
+                    yield f"data: {json.dumps({'content': content, 'done': False})}\n\n"
+            except Exception as e:
+                logger.error(f"Error streaming LLM response: {str(e)}")
+                error_data = json.dumps({'error': str(e), 'done': True})
+                yield f"data: {error_data}\n\n"
+                return
             
             yield f"data: {json.dumps({'content': '', 'done': True})}\n\n"
         
@@ -394,10 +377,20 @@ async def chat_stream(req: ChatRequest):
 
 # === Agent Routes ===
 @router.post("/agent", response_model=AgentResponse)
-async def process_agent_request(req: AgentRequest):
+async def process_agent_request(req: AgentRequest, agent_service: AgentService = Depends(get_agent),
+                                db: AsyncSession = Depends(get_db)):
     """Process agent requests."""
     try:
-        result = await agent_service.process_request(req.user_input, req.chat_history)
+        # Older turns are dropped by the agent, so pass their summary along
+        chat_summary = None
+        if req.chat_id is not None and len(req.chat_history or []) > AGENT_MAX_HISTORY_TURNS:
+            try:
+                chat = await ChatSummaryService.get_summary(db, req.chat_id)
+                chat_summary = chat.summary
+            except NoResultFound:
+                logger.warning(f"No chat summary found for chat {req.chat_id}")
+        
+        result = await agent_service.process_request(req.user_input, req.chat_history, chat_summary)
         return AgentResponse(**result)
         
     except Exception as e:
@@ -405,7 +398,7 @@ async def process_agent_request(req: AgentRequest):
         return AgentResponse(success=False, error=str(e))
 
 @router.post("/agent/inline", response_model=AgentResponse)
-async def process_inline_chat_request(req: InlineChatRequest):
+async def process_inline_chat_request(req: InlineChatRequest, agent_service: AgentService = Depends(get_agent)):
     """Process inline chat requests."""
     try:
         result = await agent_service.process_inline_request(
@@ -419,10 +412,10 @@ async def process_inline_chat_request(req: InlineChatRequest):
         return AgentResponse(success=False, error=str(e))
 
 @router.post("/agent/tool_execution", response_model=ToolExecutionResponse)
-async def handle_tool_execution(req: ToolExecutionRequest):
+async def handle_tool_execution(req: ToolExecutionRequest, agent_service: AgentService = Depends(get_agent)):
     """Handle tool execution requests."""
     try:
-        result = agent_service.handle_tool_execution(req.tool_name, req.tool_input)
+        result = await agent_service.handle_tool_execution(req.tool_name, req.tool_input)
         return ToolExecutionResponse(success=True, result=result)
         
     except Exception as e:
@@ -430,7 +423,7 @@ async def handle_tool_execution(req: ToolExecutionRequest):
         return ToolExecutionResponse(success=False, error=str(e))
 
 @router.get("/agent/tools")
-async def list_available_tools():
+async def list_available_tools(agent_service: AgentService = Depends(get_agent)):
     """List available tools."""
     try:
         tools = agent_service.get_available_tools()
@@ -6,9 +6,18 @@ from typing import Optional
 
 # LLM Configuration
 LLM_URL = os.getenv("LLM_URL", "http://100.115.151.29:8080/completion")
+# Comma-separated completion endpoints to balance across (defaults to LLM_URL)
+LLM_URLS = [url.strip() for url in os.getenv("LLM_URLS", "").split(",") if url.strip()] or [LLM_URL]
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.7"))
 LLM_N_PREDICT = int(os.getenv("LLM_N_PREDICT", "300"))
 LLM_STOP_TOKENS = ["\nUser:", "\nAssistant:"]
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+LLM_RETRY_TOTAL = int(os.getenv("LLM_RETRY_TOTAL", "3"))
+LLM_RETRY_BACKOFF_S = float(os.getenv("LLM_RETRY_BACKOFF_S", "0.2"))
+# Circuit breaker: open after N failures within the window, probe again after the reset delay
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_WINDOW_S = float(os.getenv("LLM_BREAKER_WINDOW_S", "10"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
 
 # ChromaDB Configuration
 CHROMA_DB_DIR = os.getenv("CHROMA_DB_DIR", "chroma_db")
@@ -18,6 +27,14 @@ COLLECTION_NAME = os.getenv("COLLECTION_NAME", "papers_v2")
 FINE_CHUNKS_COLLECTION = os.getenv("FINE_CHUNKS_COLLECTION", "fine_chunks")
 COARSE_CHUNKS_COLLECTION = os.getenv("COARSE_CHUNKS_COLLECTION", "coarse_chunks")
 
+# HNSW index parameters (applied when a collection is first created).
+# similarity_score is reported on the squared-L2 scale whatever the space.
+HNSW_SPACE = os.getenv("HNSW_SPACE", "l2")
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_CONSTRUCTION_EF = int(os.getenv("HNSW_CONSTRUCTION_EF", "200"))
+HNSW_SEARCH_EF_FINE = int(os.getenv("HNSW_SEARCH_EF_FINE", "64"))
+HNSW_SEARCH_EF_COARSE = int(os.getenv("HNSW_SEARCH_EF_COARSE", "32"))
+
 # Fine Chunks Configuration (for citation suggestion and sentence-level similarity)
 FINE_CHUNK_MIN_CHARS = int(os.getenv("FINE_CHUNK_MIN_CHARS", "300"))
 FINE_CHUNK_MAX_CHARS = int(os.getenv("FINE_CHUNK_MAX_CHARS", "500"))
@@ -32,6 +49,8 @@ COARSE_CHUNK_MAX_TOKENS = int(os.getenv("COARSE_CHUNK_MAX_TOKENS", "512"))
 
 # Embedding Configuration
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "intfloat/e5-base-v2")
+EMBEDDING_FP16 = os.getenv("EMBEDDING_FP16", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
 
 # Text Processing Configuration
 MAX_CHUNK_LENGTH = int(os.getenv("MAX_CHUNK_LENGTH", "1500"))
@@ -61,6 +80,16 @@ LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 # Agent Configuration
 AGENT_TEMPERATURE = float(os.getenv("AGENT_TEMPERATURE", "0.7"))
 AGENT_N_PREDICT = int(os.getenv("AGENT_N_PREDICT", "300"))
+AGENT_MAX_HISTORY_TURNS = int(os.getenv("AGENT_MAX_HISTORY_TURNS", "12"))
+AGENT_TIMEOUT_S = float(os.getenv("AGENT_TIMEOUT_S", "120"))
 
 # Search Configuration
-DEFAULT_SEARCH_K = int(os.getenv("DEFAULT_SEARCH_K", "5")) 
\ No newline at end of file
+DEFAULT_SEARCH_K = int(os.getenv("DEFAULT_SEARCH_K", "5"))
+SEMANTIC_QUERY_CACHE_SIZE = int(os.getenv("SEMANTIC_QUERY_CACHE_SIZE", "1024"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "~/.cache/ra/semq.jsonl")
+SEMANTIC_CACHE_SIMILARITY = float(os.getenv("SEMANTIC_CACHE_SIMILARITY", "0.95"))
+SEMANTIC_CACHE_MIN_JACCARD = float(os.getenv("SEMANTIC_CACHE_MIN_JACCARD", "0.7"))
+# Paraphrase entries kept in memory; the oldest are overwritten once full
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+# Questions with at least this many words and no vague references skip LLM rewriting
+QUERY_REWRITE_MIN_WORDS = int(os.getenv("QUERY_REWRITE_MIN_WORDS", "6"))
\ No newline at end of file
@@ -10,6 +10,7 @@ from .models.chat_summary import Base as ChatSummaryBase
 
 from .config import API_HOST, API_PORT, CORS_ORIGINS, LOG_LEVEL, LOG_FORMAT
 from .api.routes import router
+from .utils.text_processing import preload_tokenizers
 
 # Configure logging
 logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
@@ -53,6 +54,7 @@ async def root():
 
 @app.on_event("startup")
 async def on_startup():
+    preload_tokenizers()
     async with engine.begin() as conn:
         await conn.run_sync(ChatSummaryBase.metadata.create_all)
 
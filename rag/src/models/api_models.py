@@ -49,6 +49,7 @@ class AgentRequest(BaseModel):
     user_input: str
     chat_history: Optional[List[Dict[str, str]]] = []
     user_id: Optional[str] = None
+    chat_id: Optional[int] = None  # Chat summary used for truncated history
 
 class InlineChatRequest(BaseModel):
     user_input: str
@@ -83,7 +84,7 @@ class ChunkInfo(BaseModel):
     text: str
     metadata: Dict[str, Any]
     text_length: int
-    embedding_preview: List[float]
+    embedding_preview: Optional[List[float]] = None
 
 class ListChunksResponse(BaseModel):
     chunks: List[ChunkInfo]
@@ -1,24 +1,36 @@
 """
 Agent service for the RAG server.
 """
+import asyncio
 import logging
-import json
-import requests
+import orjson
+from functools import lru_cache
 from typing import List, Dict, Any, Optional
-from langchain.agents import AgentExecutor, create_openai_functions_agent, create_structured_chat_agent
+from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain.tools import BaseTool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.output_parsers import StrOutputParser
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.outputs import ChatResult, ChatGeneration
 from pydantic import BaseModel, Field
 
-from ..config import LLM_URL, AGENT_TEMPERATURE, AGENT_N_PREDICT, LLM_STOP_TOKENS
+from ..config import (
+    AGENT_TEMPERATURE, AGENT_N_PREDICT, LLM_STOP_TOKENS,
+    AGENT_MAX_HISTORY_TURNS, AGENT_TIMEOUT_S,
+)
+from ..utils.llm_client import call_llm, call_llm_sync, create_semantic_query
 
 logger = logging.getLogger(__name__)
 
+_SYSTEM_PREAMBLE = "You are a helpful AI coding assistant. You help users with development tasks and can execute terminal commands when needed.\n\n"
+_ROLE_PREFIXES = {"human": "User: ", "ai": "Assistant: "}
+
+def _normalize_message(message: Any) -> tuple:
+    """Return a (type, content) pair for a LangChain message or a plain dict."""
+    if isinstance(message, dict):
+        return message.get("type"), message.get("content")
+    return getattr(message, "type", None), getattr(message, "content", None)
+
 class LlamaCppChat(BaseChatModel):
     """
     LangChain-compatible chat model for llama.cpp HTTP endpoint.
@@ -28,60 +40,35 @@ class LlamaCppChat(BaseChatModel):
     temperature: float = AGENT_TEMPERATURE
     n_predict: int = AGENT_N_PREDICT
     stop: Optional[list] = LLM_STOP_TOKENS
-    endpoint_url: str = LLM_URL
 
     def _convert_messages(self, messages: List[Any]) -> str:
-        # Start with a clear system message to reset context
-        prompt = "You are a helpful AI coding assistant. You help users with development tasks and can execute terminal commands when needed.\n\n"
+        # Normalize each message once into a (type, content) pair
+        pairs = [_normalize_message(message) for message in messages]
         
-        # Add conversation history
-        for message in messages:
-            if hasattr(message, "type"):
-                mtype = message.type
-                content = message.content
-            else:
-                mtype = message.get("type")
-                content = message.get("content")
-            
-            if mtype == "human":
-                prompt += f"User: {content}\n"
-            elif mtype == "ai":
-                prompt += f"Assistant: {content}\n"
-            elif mtype == "system":
-                # Skip system messages as we already have the system prompt
-                continue
+        # Start with a clear system message to reset context, then add the
+        # conversation history (system messages are covered by the preamble)
+        parts = [_SYSTEM_PREAMBLE]
+        parts.extend(f"{_ROLE_PREFIXES[mtype]}{content}\n" for mtype, content in pairs if mtype in _ROLE_PREFIXES)
+        parts.append("Assistant: ")
         
-        # Add the final user message if it's not already there
-        if messages and hasattr(messages[-1], "type") and messages[-1].type == "human":
-            prompt += "Assistant: "
-        elif messages and messages[-1].get("type") == "human":
-            prompt += "Assistant: "
-        else:
-            prompt += "Assistant: "
-            
-        return prompt
+        return "".join(parts)
 
     def _call(self, messages: List[Dict[str, Any]], **kwargs) -> str:
         prompt = self._convert_messages(messages)
-        
-        # Debug: Print the prompt being sent
-        print(f"=== PROMPT SENT TO LLAMA.CPP ===")
-        print(prompt)
-        print("=== END PROMPT ===")
-        
-        response = requests.post(self.endpoint_url, json={
-            "prompt": prompt,
-            "temperature": self.temperature,
-            "n_predict": self.n_predict,
-            "stream": False,
-            "stop": self.stop
-        })
-        
-        content = response.json().get("content", "")
-        print(f"=== RESPONSE FROM LLAMA.CPP ===")
-        print(content)
-        print("=== END RESPONSE ===")
-        
+        logger.debug(f"Prompt sent to llama.cpp:\n{prompt}")
+        content = call_llm_sync(prompt, self.temperature, self.n_predict, stop=self.stop)
+        logger.debug(f"Response from llama.cpp:\n{content}")
+        return content
+
+    async def _acall(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        # Go through the shared client for endpoint balancing, retries and circuit breakers
+        prompt = self._convert_messages(messages)
+        logger.debug(f"Prompt sent to llama.cpp:\n{prompt}")
+        content = await asyncio.wait_for(
+            call_llm(prompt, self.temperature, self.n_predict, stop=self.stop),
+            timeout=AGENT_TIMEOUT_S
+        )
+        logger.debug(f"Response from llama.cpp:\n{content}")
         return content
 
     def invoke(self, input, **kwargs):
@@ -92,18 +79,23 @@ class LlamaCppChat(BaseChatModel):
 
     def bind(self, **kwargs):
         # For LangChain compatibility (returns a copy with updated params)
-        params = self.dict()
-        params.update(kwargs)
-        return LlamaCppChat(**params)
+        # Copying skips the field snapshot and re-validation of a fresh model
+        return self.copy(update=kwargs)
 
     def _generate(self, messages, stop=None, run_manager=None, **kwargs):
         content = self._call(messages, stop=stop or self.stop)
         return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
 
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content = await self._acall(messages, stop=stop or self.stop)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
     @property
     def _llm_type(self) -> str:
         return "llama.cpp"
 
+_TERMINAL_PAYLOAD = {"tool": "terminal_command", "needs_execution": True}
+
 class TerminalTool(BaseTool):
     """Tool for executing terminal commands on the user's machine"""
     
@@ -116,11 +108,7 @@ class TerminalTool(BaseTool):
     def _run(self, command: str) -> str:
         """This will be called by the VS Code extension, not directly"""
         # Return a special format that the extension can recognize
-        return json.dumps({
-            "tool": "terminal_command",
-            "command": command,
-            "needs_execution": True
-        })
+        return orjson.dumps({**_TERMINAL_PAYLOAD, "command": command}).decode()
     
     async def _arun(self, command: str) -> str:
         return self._run(command)
@@ -136,20 +124,25 @@ class RAGSearchTool(BaseTool):
         query: str = Field(description="The search query")
         k: int = Field(default=5, description="Number of results to return")
     
-    def _run(self, query: str, k: int = 5) -> str:
-        """Execute the search tool."""
+    def _run(self, query: str, k: int = 5, semantic_query: Optional[str] = None) -> str:
+        """
+        Execute the search tool.
+        
+        The LLM query rewrite is async, so synchronous callers search with the
+        original query only; _arun rewrites it first.
+        """
         try:
-            # Create semantic query
-            semantic_query = self._create_semantic_query(query)
+            # Embed the original and rewritten queries together in one batch
+            queries = [query] if not semantic_query or semantic_query == query else [query, semantic_query]
             
             # Determine which collection to search based on query type
             # Use fine chunks for citation-related queries, coarse for general questions
             if any(word in query.lower() for word in ['cite', 'citation', 'reference', 'quote']):
                 # Use fine chunks for citation suggestions
-                results = self.vector_store.search_collection(semantic_query, k, "fine")
+                results = self.vector_store.search_collection(queries, k, "fine")
             else:
                 # Use coarse chunks for general question answering
-                results = self.vector_store.search_collection(semantic_query, k, "coarse")
+                results = self.vector_store.search_collection(queries, k, "coarse")
             
             return self._format_search_results(results)
             
@@ -157,44 +150,23 @@ class RAGSearchTool(BaseTool):
             logger.error(f"Error in RAG search tool: {e}")
             return f"Error searching knowledge base: {str(e)}"
     
-    def _create_semantic_query(self, user_question: str) -> str:
-        """Create a semantic query using the LLM"""
-        prompt = f"""You are a research assistant helping users retrieve the most relevant content from a vector database of academic paper chunks.
-
-Given a user question, rewrite it into a clear, specific, and semantically rich query suitable for embedding and similarity-based retrieval.
-
-User Question:
-{user_question}
-
-Rewritten Semantic Search Query:"""
-
-        try:
-            response = requests.post(LLM_URL, json={
-                "prompt": prompt,
-                "temperature": 0.3,
-                "n_predict": 100,
-                "stream": False,
-                "stop": ["\nUser:", "\nAssistant:", "\n\n"]
-            })
-            rewritten_query = response.json().get("content", "").strip()
-            
-            return rewritten_query if rewritten_query else user_question
-        except Exception:
-            return user_question
-    
     def _format_search_results(self, results: Dict[str, Any]) -> str:
         """Format search results for the agent"""
         if not results.get("results"):
             return "No relevant results found in the knowledge base."
         
-        formatted_results = []
-        for i, result in enumerate(results["results"], 1):
-            formatted_results.append(f"Result {i}:\n{result['text']}\n")
-        
-        return "\n".join(formatted_results)
+        return "\n".join(self._iter_formatted_results(results))
+    
+    def _iter_formatted_results(self, results: Dict[str, Any]):
+        """Yield formatted search results one at a time for incremental consumers"""
+        for i, result in enumerate(results.get("results", []), 1):
+            yield f"Result {i}:\n{result['text']}\n"
     
     async def _arun(self, query: str, k: int = 5) -> str:
-        return self._run(query, k)
+        # Share the routes' query rewriting and cache, then search in a worker
+        # thread since embedding and the vector store are blocking
+        semantic_query = await create_semantic_query(query)
+        return await asyncio.to_thread(self._run, query, k, semantic_query)
 
 class AgentService:
     """Main agent service that orchestrates the LangChain agent"""
@@ -249,13 +221,18 @@ Always be careful with terminal commands and explain what you're doing before ex
         agent = create_openai_functions_agent(self.llm, self.tools, prompt)
         return agent
     
-    async def process_request(self, user_input: str, chat_history: List[Dict] = None) -> Dict[str, Any]:
+    async def process_request(self, user_input: str, chat_history: List[Dict] = None,
+                              chat_summary: Optional[str] = None) -> Dict[str, Any]:
         """
         Process a user request through the agent.
         
+        Only the last AGENT_MAX_HISTORY_TURNS turns are sent to the agent; older
+        turns are represented by the chat summary when one is provided.
+        
         Args:
             user_input: The user's input
             chat_history: Optional chat history
+            chat_summary: Optional summary of the conversation so far
             
         Returns:
             Dictionary with response information
@@ -263,6 +240,10 @@ Always be careful with terminal commands and explain what you're doing before ex
         try:
             # Convert chat history to LangChain format
             messages = []
+            if chat_history and len(chat_history) > AGENT_MAX_HISTORY_TURNS:
+                chat_history = chat_history[-AGENT_MAX_HISTORY_TURNS:]
+                if chat_summary:
+                    messages.append(HumanMessage(content=f"Summary of our earlier conversation:\n{chat_summary}"))
             if chat_history:
                 for turn in chat_history:
                     if turn.get("user"):
@@ -282,6 +263,12 @@ Always be careful with terminal commands and explain what you're doing before ex
                 "tool_calls": []  # LangChain doesn't expose tool calls directly
             }
             
+        except asyncio.TimeoutError:
+            logger.error(f"LLM timed out after {AGENT_TIMEOUT_S}s processing agent request")
+            return {
+                "success": False,
+                "error": "llm_timeout"
+            }
         except Exception as e:
             logger.error(f"Error processing agent request: {str(e)}")
             return {
@@ -289,7 +276,7 @@ Always be careful with terminal commands and explain what you're doing before ex
                 "error": str(e)
             }
     
-    def handle_tool_execution(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
+    async def handle_tool_execution(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
         """
         Handle tool execution requests.
         
@@ -313,9 +300,10 @@ Always be careful with terminal commands and explain what you're doing before ex
             
             # Execute the tool
             if tool_name == "terminal_command":
-                return tool._run(tool_input.get("command", ""))
+                return await tool._arun(tool_input.get("command", ""))
             elif tool_name == "rag_search":
-                return tool._run(tool_input.get("query", ""), tool_input.get("k", 5))
+                # The async path rewrites the query before searching
+                return await tool._arun(tool_input.get("query", ""), tool_input.get("k", 5))
             else:
                 return f"Unknown tool: {tool_name}"
                 
@@ -370,14 +358,21 @@ Please help with the user's question, considering the selected text and document
             messages.append(HumanMessage(content=context_prompt))
             
             # Get response from LLM
-            response = self.llm.invoke({"messages": messages})
+            response = await self.llm.ainvoke(messages)
+            content = response.content
             
             return {
                 "success": True,
-                "response": response.content,
+                "response": content,
                 "tool_calls": []
             }
             
+        except asyncio.TimeoutError:
+            logger.error(f"LLM timed out after {AGENT_TIMEOUT_S}s processing inline request")
+            return {
+                "success": False,
+                "error": "llm_timeout"
+            }
         except Exception as e:
             logger.error(f"Error processing inline request: {str(e)}")
             return {
@@ -400,5 +395,15 @@ Please help with the user's question, considering the selected text and document
             })
         return tools_info
 
-# Create global instance
-agent_service = AgentService() 
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_agent_service(vector_store=None) -> AgentService:
+    """
+    Get the shared agent service, creating it on first use.
+    
+    Args:
+        vector_store: Vector store service used by the RAG search tool
+        
+    Returns:
+        Cached AgentService instance
+    """
+    return AgentService(vector_store=vector_store)
@@ -49,7 +49,7 @@ class ChatSummaryService:
         prompt += "\n###"
         
         try:
-            llm_response = call_llm(prompt)
+            llm_response = await call_llm(prompt)
             if chat and hasattr(chat, 'summary'):
                 chat.summary = llm_response.strip() if llm_response else f"{old_summary} {new_message}".strip()
                 await session.commit()
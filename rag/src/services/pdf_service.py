@@ -2,22 +2,128 @@
 PDF service for downloading and processing research papers.
 """
 import os
+import asyncio
+import contextlib
+import hashlib
+import mmap
+import multiprocessing
+import shelve
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
 import tempfile
-from urllib.parse import urlparse, urljoin
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse
 from pathlib import Path
 import logging
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 import arxiv
 from datetime import datetime
 import pdfminer.high_level
+from pdfminer.pdfpage import PDFPage
+import pypdfium2
 
 from ..config import PAPERS_DIR
 from ..utils.text_processing import extract_arxiv_id
 
 logger = logging.getLogger(__name__)
 
+# URL patterns used to route downloads
+_DOI_RE = re.compile(r'doi\.org/(.+)')
+_SEMANTIC_SCHOLAR_ID_RE = re.compile(r'/paper/([^/]+)')
+
+# Larger reads mean fewer socket reads and file writes per multi-MB PDF
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Downloads are I/O-bound; preprint servers get a lower cap to respect their rate limits
+DOWNLOAD_WORKERS = 16
+HOST_MAX_CONCURRENT_DOWNLOADS = {
+    'arxiv.org': 4,
+    'biorxiv.org': 4,
+}
+
+# Transient failures and rate limiting are retried with exponential backoff
+DOWNLOAD_RETRY = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET"],
+)
+
+# Reject non-PDF responses early; the header may follow up to 1 KiB of junk
+PDF_MAGIC = b'%PDF'
+PDF_HEADER_SEARCH_BYTES = 1024
+MAX_PDF_BYTES = 500 * 1024 * 1024
+
+# How long a failed URL is skipped before it is retried
+FAILED_URL_TTL_S = 10 * 60
+
+# Pages per pdfminer worker task; bounds per-process memory on large PDFs
+PDFMINER_PAGES_PER_TASK = 8
+
+def _extract_pages_pdfminer(pdf_path: str, page_numbers: List[int]) -> str:
+    """Extract text for a subset of pages; module-level so worker processes can pickle it."""
+    return pdfminer.high_level.extract_text(pdf_path, page_numbers=page_numbers)
+
+_pdfminer_pool: Optional[ProcessPoolExecutor] = None
+_pdfminer_pool_lock = threading.Lock()
+
+def _get_pdfminer_pool() -> ProcessPoolExecutor:
+    """
+    Shared pdfminer worker pool, created on first use.
+
+    Extraction runs from worker threads, and forking a multi-threaded process
+    can deadlock the child, so workers are spawned instead.
+    """
+    global _pdfminer_pool
+    with _pdfminer_pool_lock:
+        if _pdfminer_pool is None:
+            _pdfminer_pool = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdfminer_pool
+
+class TextCache:
+    """On-disk cache of extracted PDF text keyed by a hash of the PDF content."""
+    
+    def __init__(self, cache_dir: Path):
+        """
+        Initialize the text cache.
+        
+        Args:
+            cache_dir: Directory to store cached text files
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    @staticmethod
+    def hash_file(pdf_path: str) -> Optional[str]:
+        """Hash a file's content without reading it into a Python bytes object."""
+        with open(pdf_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.blake2b(mm, digest_size=16).hexdigest()
+    
+    def get(self, content_hash: str) -> Optional[str]:
+        """Return cached text for a content hash, or None on a miss."""
+        cache_path = self.cache_dir / f"{content_hash}.txt"
+        try:
+            return cache_path.read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+    
+    def set(self, content_hash: str, text: str) -> None:
+        """Store extracted text for a content hash."""
+        cache_path = self.cache_dir / f"{content_hash}.txt"
+        tmp_path = cache_path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_text(text, encoding='utf-8')
+        os.replace(tmp_path, cache_path)
+
 class PDFService:
     """Service for downloading and processing PDF papers."""
     
@@ -32,6 +138,27 @@ class PDFService:
         self.papers_dir.mkdir(exist_ok=True)
         logger.info(f"PDFs will be stored in: {self.papers_dir.absolute()}")
         
+        # Shared session so TCP/TLS connections are reused across downloads
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=DOWNLOAD_RETRY)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._host_semaphores = {
+            host: threading.Semaphore(limit) for host, limit in HOST_MAX_CONCURRENT_DOWNLOADS.items()
+        }
+        
+        # Caches for extracted text (by content hash) and downloads (by URL)
+        cache_dir = self.papers_dir / ".cache"
+        self.text_cache = TextCache(cache_dir)
+        self._download_index_path = str(cache_dir / "downloads")
+        self._download_index_lock = threading.Lock()
+        
+        # URL -> monotonic time of the last failed download attempt
+        self._failed_urls = {}
+        
+        # (directory mtime, sorted PDF filenames) for list_downloaded_papers
+        self._papers_cache = None
+        
         # Common research paper domains
         self.research_domains = {
             'arxiv.org': self._download_arxiv,
@@ -58,27 +185,79 @@ class PDFService:
         try:
             logger.info(f"Attempting to download paper from: {url}")
             
+            # Skip URLs that failed recently instead of hitting the server again
+            failed_at = self._failed_urls.get(url)
+            if failed_at is not None and time.monotonic() - failed_at < FAILED_URL_TTL_S:
+                logger.info(f"Skipping recently failed URL: {url}")
+                return None
+            
+            # Reuse a previous download of the same URL if the file is still there
+            cached_path = self._get_cached_download(url)
+            if cached_path:
+                logger.info(f"Using previously downloaded PDF: {cached_path}")
+                return cached_path
+            
             # Parse URL to determine the source
             parsed_url = urlparse(url)
             domain = parsed_url.netloc.lower()
             
             # Try to find a specific handler for this domain
-            for known_domain, handler in self.research_domains.items():
+            handler = None
+            for known_domain, domain_handler in self.research_domains.items():
                 if known_domain in domain:
                     logger.info(f"Using {known_domain} handler")
-                    return handler(url, filename)
-            
-            # Fallback to generic PDF download
-            logger.info("Using generic PDF download handler")
-            return self._download_generic_pdf(url, filename)
+                    handler = domain_handler
+                    break
+            
+            if handler is None:
+                # Fallback to generic PDF download
+                logger.info("Using generic PDF download handler")
+                handler = self._download_generic_pdf
+            
+            pdf_path = handler(url, filename)
+            if pdf_path:
+                self._failed_urls.pop(url, None)
+                self._remember_download(url, pdf_path)
+            else:
+                self._failed_urls[url] = time.monotonic()
+            return pdf_path
             
         except Exception as e:
             logger.error(f"Failed to download paper from {url}: {str(e)}")
+            self._failed_urls[url] = time.monotonic()
             return None
     
+    def download_papers(self, urls: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+        """
+        Download several research papers concurrently.
+        
+        Args:
+            urls: List of (url, filename) pairs; filename may be None
+            
+        Returns:
+            Paths to downloaded PDF files in input order, None for failures
+        """
+        if not urls:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(urls))) as executor:
+            return list(executor.map(lambda item: self.download_paper(*item), urls))
+    
+    async def download_papers_async(self, urls: List[Tuple[str, Optional[str]]]) -> List[Optional[str]]:
+        """
+        Download several research papers concurrently without blocking the event loop.
+        
+        Args:
+            urls: List of (url, filename) pairs; filename may be None
+            
+        Returns:
+            Paths to downloaded PDF files in input order, None for failures
+        """
+        return await asyncio.to_thread(self.download_papers, urls)
+    
     def extract_text_from_pdf(self, pdf_path: str) -> Optional[str]:
         """
-        Extract text from a PDF file using pdfminer.
+        Extract text from a PDF file using pypdfium2 (pdfminer as fallback).
         
         Args:
             pdf_path: Path to the PDF file
@@ -96,15 +275,30 @@ class PDFService:
             if not pdf_path.lower().endswith('.pdf'):
                 logger.warning(f"File doesn't have .pdf extension: {pdf_path}")
             
+            # Identical PDFs share extracted text regardless of where they came from
+            content_hash = TextCache.hash_file(pdf_path)
+            if content_hash:
+                cached_text = self.text_cache.get(content_hash)
+                if cached_text is not None:
+                    logger.info(f"Using cached text for: {pdf_path}")
+                    return cached_text
+            
             logger.info(f"Extracting text from PDF: {pdf_path}")
             
-            # Extract text using pdfminer
-            text = pdfminer.high_level.extract_text(pdf_path)
+            # Extract text using pdfium, falling back to pdfminer for PDFs it rejects
+            try:
+                text = self._extract_text_pdfium(pdf_path)
+            except Exception as e:
+                logger.warning(f"pypdfium2 failed on {pdf_path}, falling back to pdfminer: {str(e)}")
+                text = self._extract_text_pdfminer(pdf_path)
             
             if not text or not text.strip():
                 logger.warning(f"Extracted text is empty for: {pdf_path}")
                 return None
             
+            if content_hash:
+                self.text_cache.set(content_hash, text)
+            
             logger.info(f"Successfully extracted {len(text)} characters from: {pdf_path}")
             return text
             
@@ -112,6 +306,37 @@ class PDFService:
             logger.error(f"Failed to extract text from {pdf_path}: {str(e)}")
             return None
     
+    def _extract_text_pdfium(self, pdf_path: str) -> str:
+        """Extract raw page text with pypdfium2, skipping layout analysis."""
+        pdf = pypdfium2.PdfDocument(pdf_path)
+        try:
+            pages_text = []
+            for page in pdf:
+                textpage = page.get_textpage()
+                pages_text.append(textpage.get_text_range())
+                textpage.close()
+                page.close()
+            return "\n".join(pages_text).replace("\r\n", "\n")
+        finally:
+            pdf.close()
+    
+    def _extract_text_pdfminer(self, pdf_path: str) -> str:
+        """Extract text with pdfminer, spreading groups of pages across processes."""
+        with open(pdf_path, 'rb') as fp:
+            page_count = sum(1 for _ in PDFPage.get_pages(fp))
+        
+        page_groups = [
+            list(range(start, min(start + PDFMINER_PAGES_PER_TASK, page_count)))
+            for start in range(0, page_count, PDFMINER_PAGES_PER_TASK)
+        ]
+        if len(page_groups) <= 1:
+            return pdfminer.high_level.extract_text(pdf_path)
+        
+        executor = _get_pdfminer_pool()
+        # pdfminer ends every page with a form feed, so plain concatenation
+        # reproduces the single-pass output
+        return "".join(executor.map(_extract_pages_pdfminer, [pdf_path] * len(page_groups), page_groups))
+    
     def download_arxiv_pdf_text(self, arxiv_id: str) -> str:
         """Download and extract text from an arXiv paper."""
         try:
@@ -129,12 +354,7 @@ class PDFService:
                 
                 # Use requests to download the PDF directly
                 pdf_url = f"http://arxiv.org/pdf/{arxiv_id}"
-                response = requests.get(pdf_url, stream=True, timeout=30)
-                response.raise_for_status()
-                
-                with open(pdf_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                self._stream_to_file(pdf_url, pdf_path)
                 
                 return self.extract_text_from_pdf(pdf_path)
                 
@@ -163,12 +383,7 @@ class PDFService:
             
             # Use requests to download the PDF directly
             pdf_url = f"http://arxiv.org/pdf/{arxiv_id}"
-            response = requests.get(pdf_url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            with open(pdf_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            self._stream_to_file(pdf_url, pdf_path)
             
             return str(pdf_path)
             
@@ -180,7 +395,7 @@ class PDFService:
         """Download paper from DOI link."""
         try:
             # Extract DOI from URL
-            doi_match = re.search(r'doi\.org/(.+)', url)
+            doi_match = _DOI_RE.search(url)
             if not doi_match:
                 raise ValueError("Could not extract DOI from URL")
             
@@ -223,12 +438,12 @@ class PDFService:
         """Download paper from Semantic Scholar."""
         try:
             # Try to extract paper ID and find PDF
-            paper_id_match = re.search(r'/paper/([^/]+)', url)
+            paper_id_match = _SEMANTIC_SCHOLAR_ID_RE.search(url)
             if paper_id_match:
                 paper_id = paper_id_match.group(1)
                 # Semantic Scholar API might provide PDF links
                 api_url = f"https://api.semanticscholar.org/v1/paper/{paper_id}"
-                response = requests.get(api_url)
+                response = self._session.get(api_url)
                 if response.status_code == 200:
                     data = response.json()
                     if 'pdf' in data and data['pdf']:
@@ -281,17 +496,12 @@ class PDFService:
                 if path_filename and path_filename.lower().endswith('.pdf'):
                     filename = path_filename[:-4]  # Remove .pdf extension
                 else:
-                    filename = f"paper_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                    filename = f"paper_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
             
             pdf_path = self.papers_dir / f"{filename}.pdf"
             
             # Download the PDF
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-            
-            with open(pdf_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            self._stream_to_file(url, pdf_path)
             
             if pdf_path.exists() and pdf_path.stat().st_size > 0:
                 logger.info(f"Successfully downloaded PDF: {pdf_path}")
@@ -303,17 +513,78 @@ class PDFService:
             logger.error(f"Failed to download generic PDF from {url}: {str(e)}")
             return None
     
+    def _stream_to_file(self, url: str, path) -> None:
+        """
+        Stream a PDF response body straight from the socket into a file.
+        
+        Raises ValueError, removing any partial file, if the body does not look
+        like a PDF (e.g. an HTML login page) or exceeds MAX_PDF_BYTES.
+        """
+        netloc = urlparse(url).netloc.lower()
+        limiter = next(
+            (semaphore for host, semaphore in self._host_semaphores.items() if host in netloc),
+            contextlib.nullcontext()
+        )
+        with limiter, contextlib.closing(self._session.get(url, stream=True, timeout=30)) as response:
+            response.raise_for_status()
+            
+            content_length = response.headers.get('Content-Length', '')
+            if content_length.isdigit() and int(content_length) > MAX_PDF_BYTES:
+                raise ValueError(f"PDF too large: {content_length} bytes")
+            
+            response.raw.decode_content = True
+            head = response.raw.read(PDF_HEADER_SEARCH_BYTES)
+            if PDF_MAGIC not in head:
+                raise ValueError(f"Response from {url} is not a PDF")
+            
+            try:
+                with open(path, 'wb') as f:
+                    f.write(head)
+                    bytes_written = len(head)
+                    while True:
+                        chunk = response.raw.read(DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        bytes_written += len(chunk)
+                        if bytes_written > MAX_PDF_BYTES:
+                            raise ValueError(f"PDF exceeds {MAX_PDF_BYTES} bytes")
+                        f.write(chunk)
+            except Exception:
+                Path(path).unlink(missing_ok=True)
+                raise
+    
+    def _get_cached_download(self, url: str) -> Optional[str]:
+        """Return the stored path for a previously downloaded URL if it still exists."""
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        with self._download_index_lock, shelve.open(self._download_index_path) as index:
+            pdf_path = index.get(key)
+        if pdf_path and os.path.exists(pdf_path):
+            return pdf_path
+        return None
+    
+    def _remember_download(self, url: str, pdf_path: str) -> None:
+        """Record the path a URL was downloaded to."""
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        with self._download_index_lock, shelve.open(self._download_index_path) as index:
+            index[key] = pdf_path
+    
     def list_downloaded_papers(self) -> list:
         """
         List all downloaded papers.
         
+        The listing is cached and rebuilt only when the directory mtime changes.
+        
         Returns:
             List of paper filenames
         """
-        papers = []
-        for pdf_file in self.papers_dir.glob("*.pdf"):
-            papers.append(pdf_file.name)
-        return sorted(papers)
+        mtime = os.stat(self.papers_dir).st_mtime_ns
+        if self._papers_cache is not None and self._papers_cache[0] == mtime:
+            return list(self._papers_cache[1])
+        
+        with os.scandir(self.papers_dir) as entries:
+            papers = sorted(entry.name for entry in entries if entry.name.endswith('.pdf') and entry.is_file())
+        self._papers_cache = (mtime, papers)
+        return list(papers)
     
     def get_paper_info(self, filename: str) -> Optional[dict]:
         """
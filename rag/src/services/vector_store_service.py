@@ -2,28 +2,25 @@
 Vector store service for managing ChromaDB operations and embeddings.
 """
 import os
+import heapq
 import logging
+import threading
+from collections import OrderedDict
 import chromadb
-from chromadb import Client
-from chromadb.config import Settings
-from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
-from typing import List, Dict, Any, Optional
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from typing import List, Dict, Any, Optional, Tuple, Union
 import uuid
-import pdb
+from concurrent.futures import ThreadPoolExecutor
 from sentence_transformers import SentenceTransformer
 
 
 from ..config import (
     CHROMA_DB_DIR,
-    COLLECTION_NAME,
     FINE_CHUNKS_COLLECTION,
     COARSE_CHUNKS_COLLECTION,
     EMBEDDING_MODEL,
-    ADVANCED_CHUNKING_ENABLED,
-    MIN_TOKENS_PER_CHUNK,
-    MAX_TOKENS_PER_CHUNK,
-    OVERLAP_TOKENS,
-    TOKENIZER_MODEL,
+    EMBEDDING_FP16,
+    QUERY_EMBEDDING_CACHE_SIZE,
     FINE_CHUNK_MIN_CHARS,
     FINE_CHUNK_MAX_CHARS,
     FINE_CHUNK_MIN_SENTENCES,
@@ -32,17 +29,58 @@ from ..config import (
     COARSE_CHUNK_MAX_CHARS,
     COARSE_CHUNK_MIN_TOKENS,
     COARSE_CHUNK_MAX_TOKENS,
+    HNSW_SPACE,
+    HNSW_M,
+    HNSW_CONSTRUCTION_EF,
+    HNSW_SEARCH_EF_FINE,
+    HNSW_SEARCH_EF_COARSE,
 )
-from ..utils.text_processing import (
-    chunk_by_paragraphs, 
-    advanced_chunk_by_structure, 
-    ChunkingConfig,
-    create_fine_chunks,
-    create_coarse_chunks
-)
+from ..utils.text_processing import create_fine_chunks, create_coarse_chunks
 
 logger = logging.getLogger(__name__)
 
+# Number of records fetched per page when listing chunks
+LIST_CHUNKS_PAGE_SIZE = 100
+
+def _paper_key(metadata: Dict[str, Any]) -> Optional[str]:
+    """
+    Key identifying a paper's chunks: its arXiv id, else its URL, else its citation key.
+
+    Keyed by source so that papers sharing a citation key do not overwrite each other.
+    """
+    return metadata.get('arxiv_id') or metadata.get('url') or metadata.get('citation_key')
+
+def _chunk_id(metadata: Dict[str, Any]) -> str:
+    """Derive a deterministic chunk id from its metadata, or a random one."""
+    paper_key = _paper_key(metadata)
+    try:
+        if paper_key:
+            return f"{paper_key}:{metadata['chunk_type']}:{metadata['chunk_index']}"
+    except KeyError:
+        pass
+    return uuid.uuid4().hex
+
+def _similarity_score(distance: float, space: str) -> float:
+    """
+    Convert a Chroma distance to the squared-L2 similarity scale (1 - distance).
+
+    For normalized embeddings the squared-L2 distance is 2 - 2*cos, so the
+    score is 2*cos - 1. Cosine and inner-product distances are 1 - cos and are
+    rescaled to match, keeping score thresholds stable across index spaces.
+    """
+    if space in ("cosine", "ip"):
+        return 1.0 - 2.0 * distance
+    return 1.0 - distance
+
+class SharedModelEmbeddingFunction(EmbeddingFunction):
+    """Chroma embedding function backed by an already loaded SentenceTransformer."""
+
+    def __init__(self, model: SentenceTransformer):
+        self.model = model
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.model.encode(list(input), batch_size=64, convert_to_numpy=True, show_progress_bar=False).tolist()
+
 class VectorStoreService:
     """Service for managing vector store operations with dual collections."""
 
@@ -52,54 +90,96 @@ class VectorStoreService:
 
         os.makedirs(self.db_dir, exist_ok=True)
 
-        self.embedding_model = SentenceTransformerEmbeddingFunction(model_name=EMBEDDING_MODEL)
         self.model = SentenceTransformer(EMBEDDING_MODEL)
-        logger.info(f"Loaded embedding model: {EMBEDDING_MODEL}")
+        # Half precision halves weight memory and doubles throughput on GPU;
+        # CPU kernels for fp16 are slow, so keep fp32 there
+        if EMBEDDING_FP16 and self.model.device.type == "cuda":
+            self.model.half()
+        # Chroma embeds through the same model instead of loading a second copy
+        self.embedding_model = SharedModelEmbeddingFunction(self.model)
+        logger.info(f"Loaded embedding model: {EMBEDDING_MODEL} on {self.model.device}")
 
         self.client = chromadb.PersistentClient(path=self.db_dir)
         
         # Initialize both collections
-        self.fine_collection = self.client.get_or_create_collection(
-            name=FINE_CHUNKS_COLLECTION,
-            embedding_function=self.embedding_model
-        )
-        
-        self.coarse_collection = self.client.get_or_create_collection(
-            name=COARSE_CHUNKS_COLLECTION,
-            embedding_function=self.embedding_model
-        )
+        self.fine_collection = self._get_or_create_collection(FINE_CHUNKS_COLLECTION)
+        self.coarse_collection = self._get_or_create_collection(COARSE_CHUNKS_COLLECTION)
         
         logger.info(f"Connected to collections: {FINE_CHUNKS_COLLECTION}, {COARSE_CHUNKS_COLLECTION}")
 
+        # Used to query the fine and coarse collections in parallel
+        self._query_executor = ThreadPoolExecutor(max_workers=2)
+
+        # LRU cache of query text -> embedding, valid for the lifetime of self.model
+        self._query_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+
+    def _get_or_create_collection(self, name: str):
+        """
+        Open a collection by name, creating it with the shared embedding function.
+
+        HNSW index parameters only take effect when the collection is created.
+        """
+        search_ef = HNSW_SEARCH_EF_COARSE if name == COARSE_CHUNKS_COLLECTION else HNSW_SEARCH_EF_FINE
+        return self.client.get_or_create_collection(
+            name=name,
+            embedding_function=self.embedding_model,
+            metadata={
+                "hnsw:space": HNSW_SPACE,
+                "hnsw:M": HNSW_M,
+                "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": search_ef,
+            }
+        )
+
     def add_texts_to_collection(self, texts: List[str], metadatas: Optional[List[Dict[str, Any]]] = None, 
-                               collection_name: str = "fine") -> bool:
-        """Add texts with embeddings to a specific collection."""
+                               collection_name: str = "fine",
+                               embeddings: Optional[List[List[float]]] = None,
+                               ids: Optional[List[str]] = None) -> bool:
+        """
+        Add texts with embeddings to a specific collection.
+
+        Precomputed embeddings, when given, are stored as-is so Chroma does not
+        re-embed the texts. Without explicit ids, chunks carrying citation_key,
+        chunk_type and chunk_index metadata get deterministic ids. Existing ids
+        are overwritten, so re-ingesting a paper replaces its chunks instead of
+        duplicating or keeping stale ones.
+        """
         try:
             if not texts:
                 return False
 
-            clean_texts = [t for t in texts if t]
+            keep = [i for i, t in enumerate(texts) if t]
+            clean_texts = [texts[i] for i in keep]
 
             if not clean_texts:
                 raise ValueError("No valid texts to embed.")
 
-            ids = [str(uuid.uuid4()) for _ in range(len(clean_texts))]
-
             if metadatas is None:
-                metadatas = [{"source": "unknown"} for _ in clean_texts]
+                metadatas = [{"source": "unknown"} for _ in texts]
 
             clean_metadatas = [
-                {k: v for k, v in md.items() if v is not None}
-                for md in metadatas
+                {k: v for k, v in metadatas[i].items() if v is not None}
+                for i in keep
             ]
 
+            if ids is None:
+                clean_ids = [_chunk_id(md) for md in clean_metadatas]
+            else:
+                clean_ids = [ids[i] for i in keep]
+
             # Choose collection based on name
             collection = self.fine_collection if collection_name == "fine" else self.coarse_collection
 
-            collection.add(
+            add_kwargs = {}
+            if embeddings is not None:
+                add_kwargs["embeddings"] = [embeddings[i] for i in keep]
+
+            collection.upsert(
                 documents=clean_texts,
-                ids=ids,
-                metadatas=clean_metadatas
+                ids=clean_ids,
+                metadatas=clean_metadatas,
+                **add_kwargs
             )
             logger.info(f"Added {len(clean_texts)} texts to {collection_name} collection")
             return True
@@ -108,37 +188,99 @@ class VectorStoreService:
             logger.error(f"Error adding texts to {collection_name} collection: {e}")
             return False
 
-    def search_collection(self, query: str, k: int = 5, collection_name: str = "fine") -> Dict[str, Any]:
-        """Search for similar texts in a specific collection."""
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts with the loaded sentence transformer.
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            One embedding per text
+        """
+        return self.model.encode(texts, batch_size=64, convert_to_numpy=True, show_progress_bar=False).tolist()
+
+    def _encode_queries(self, query: Union[str, List[str]]) -> List[List[float]]:
+        """
+        Embed one or more queries, serving repeats from an LRU cache.
+
+        Cache misses are embedded together in a single batched encode call.
+        """
+        queries = [query] if isinstance(query, str) else list(query)
+
+        embeddings = {}
+        with self._query_cache_lock:
+            for q in queries:
+                if q in self._query_cache:
+                    self._query_cache.move_to_end(q)
+                    embeddings[q] = self._query_cache[q]
+
+        misses = [q for q in dict.fromkeys(queries) if q not in embeddings]
+        if misses:
+            vectors = self.model.encode(misses, batch_size=32, convert_to_numpy=True).tolist()
+            with self._query_cache_lock:
+                for q, vector in zip(misses, vectors):
+                    # Tuples keep cached vectors immutable
+                    embeddings[q] = tuple(vector)
+                    self._query_cache[q] = embeddings[q]
+                    self._query_cache.move_to_end(q)
+                while len(self._query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                    self._query_cache.popitem(last=False)
+
+        return [list(embeddings[q]) for q in queries]
+
+    def search_collection(self, query: Union[str, List[str]], k: int = 5, collection_name: str = "fine",
+                          query_embeddings: Optional[List[List[float]]] = None) -> Dict[str, Any]:
+        """
+        Search for similar texts in a specific collection.
+
+        Multiple queries are embedded in a single batched encode call and their
+        results are merged, keeping the closest distance for each chunk.
+        Precomputed query embeddings may be passed to skip encoding.
+        """
         try:
-            query_embedding = self.model.encode(query, convert_to_numpy=True).tolist()
+            if query_embeddings is None:
+                query_embeddings = self._encode_queries(query)
 
             # Choose collection based on name
             collection = self.fine_collection if collection_name == "fine" else self.coarse_collection
 
             results = collection.query(
-                query_embeddings=[query_embedding],
+                query_embeddings=query_embeddings,
                 n_results=k,
                 include=["documents", "metadatas", "distances"]
             )
 
+            # Merge per-query hits, keeping the best distance for each chunk id
+            best_hits = {}
+            if results['documents']:
+                for ids, docs, metadatas, distances in zip(
+                    results['ids'],
+                    results['documents'],
+                    results['metadatas'],
+                    results['distances']
+                ):
+                    for chunk_id, doc, metadata, distance in zip(ids, docs, metadatas, distances):
+                        distance = float(distance)
+                        if chunk_id not in best_hits or distance < best_hits[chunk_id][2]:
+                            best_hits[chunk_id] = (doc, metadata, distance)
+
+            ranked_hits = sorted(best_hits.values(), key=lambda hit: hit[2])[:k]
+            # Stores created before the space was configurable use Chroma's l2 default
+            space = (collection.metadata or {}).get("hnsw:space", "l2")
+
             formatted_results = []
-            if results['documents'] and results['documents'][0]:
-                for i, (doc, metadata, distance) in enumerate(zip(
-                    results['documents'][0],
-                    results['metadatas'][0],
-                    results['distances'][0]
-                )):
-                    # Convert distance to similarity score (1 - distance)
-                    similarity_score = 1.0 - float(distance)
-                    formatted_results.append({
-                        'text': doc,
-                        'metadata': metadata or {},
-                        'distance': float(distance),
-                        'similarity_score': similarity_score,
-                        'rank': i + 1,
-                        'collection': collection_name
-                    })
+            for i, (doc, metadata, distance) in enumerate(ranked_hits):
+                # Convert distance to similarity score on the l2 scale (1 - distance)
+                similarity_score = _similarity_score(distance, space)
+                formatted_results.append({
+                    'text': doc,
+                    'metadata': metadata or {},
+                    'distance': distance,
+                    'similarity_score': similarity_score,
+                    'rank': i + 1,
+                    'collection': collection_name
+                })
 
             return {"results": formatted_results}
 
@@ -149,12 +291,14 @@ class VectorStoreService:
     def search_both_collections(self, query: str, k_fine: int = 3, k_coarse: int = 2) -> Dict[str, Any]:
         """Search both collections and combine results."""
         try:
-            fine_results = self.search_collection(query, k_fine, "fine")
-            coarse_results = self.search_collection(query, k_coarse, "coarse")
+            # Encode once and query both collections concurrently
+            query_embeddings = self._encode_queries(query)
+            fine_future = self._query_executor.submit(self.search_collection, query, k_fine, "fine", query_embeddings)
+            coarse_future = self._query_executor.submit(self.search_collection, query, k_coarse, "coarse", query_embeddings)
             
-            # Combine and sort by similarity score
-            all_results = fine_results["results"] + coarse_results["results"]
-            all_results.sort(key=lambda x: x["similarity_score"], reverse=True)
+            # Combine and keep the best results by similarity score
+            all_results = fine_future.result()["results"] + coarse_future.result()["results"]
+            all_results = heapq.nlargest(k_fine + k_coarse, all_results, key=lambda x: x["similarity_score"])
             
             return {"results": all_results}
             
@@ -164,131 +308,224 @@ class VectorStoreService:
 
     def ingest_paper_text(self, text: str, paper_metadata: Dict[str, Any]) -> bool:
         """Ingest paper text into both fine and coarse collections."""
-        try:
-            # Robust bibtex and citation_key generation using available metadata
-            citation_key = None
-            bibtex = None
-            title = paper_metadata.get('title', 'Unknown Title')
-            authors = paper_metadata.get('authors', ['Unknown'])
-            year = paper_metadata.get('year', 'xxxx')
-            arxiv_id = paper_metadata.get('arxiv_id', None)
-
-            # citation_key: firstauthorYYYYfirstwordoftitle or arxiv_id
-            if authors and authors[0] != 'Unknown' and year != 'xxxx' and title != 'Unknown Title':
-                first_author = authors[0].split()[-1]
-                first_word_title = title.split()[0].lower()
-                citation_key = f"{first_author.lower()}{year}{first_word_title}"
-            elif arxiv_id:
-                citation_key = arxiv_id
-            else:
-                citation_key = title.replace(' ', '_')[:20]
-
-            # bibtex
-            if arxiv_id:
-                bibtex = (
-                    f"@article{{{citation_key},\n"
-                    f"  title={{ {title} }},\n"
-                    f"  author={{ {' and '.join(authors)} }},\n"
-                    f"  year={{ {year} }},\n"
-                    f"  eprint={{ {arxiv_id} }},\n"
-                    f"  archivePrefix={{arXiv}},\n"
-                    f"  url={{ https://arxiv.org/abs/{arxiv_id} }}\n"
-                    f"}}"
-                )
-            else:
-                bibtex = (
-                    f"@misc{{{citation_key},\n"
-                    f"  title={{ {title} }},\n"
-                    f"  author={{ {' and '.join(authors)} }},\n"
-                    f"  year={{ {year} }},\n"
-                    f"  url={{ {paper_metadata.get('url', '')} }}\n"
-                    f"}}"
-                )
+        return self.ingest_papers([(text, paper_metadata)])
 
-            # Create fine chunks
-            fine_chunks = create_fine_chunks(
-                text, 
-                min_chars=FINE_CHUNK_MIN_CHARS,
-                max_chars=FINE_CHUNK_MAX_CHARS,
-                min_sentences=FINE_CHUNK_MIN_SENTENCES,
-                max_sentences=FINE_CHUNK_MAX_SENTENCES
-            )
+    def ingest_papers(self, papers: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """
+        Ingest several papers with one encode call and one upsert per collection.
 
-            # Create coarse chunks
-            coarse_chunks = create_coarse_chunks(
-                text,
-                min_chars=COARSE_CHUNK_MIN_CHARS,
-                max_chars=COARSE_CHUNK_MAX_CHARS,
-                min_tokens=COARSE_CHUNK_MIN_TOKENS,
-                max_tokens=COARSE_CHUNK_MAX_TOKENS
-            )
+        Args:
+            papers: List of (text, paper_metadata) pairs
 
+        Returns:
+            True if chunks were added to both collections
+        """
+        try:
+            # One entry per paper key (the last one wins), since duplicate ids
+            # in a single upsert make Chroma reject the whole batch
+            prepared_papers = {}
+            for text, paper_metadata in papers:
+                paper_key, prepared = self._prepare_paper_chunks(text, paper_metadata)
+                if not prepared["fine"][0] and not prepared["coarse"][0]:
+                    logger.warning(f"No chunks produced for paper: {paper_metadata.get('title')}")
+                    continue
+                if paper_key in prepared_papers:
+                    logger.warning(f"Paper {paper_key} appears more than once; ingesting the last copy")
+                prepared_papers[paper_key] = prepared
+
+            batches = {name: ([], [], []) for name in ("fine", "coarse")}
+            stale_ids = {name: [] for name in ("fine", "coarse")}
+            for paper_key, prepared in prepared_papers.items():
+                for name, (chunks, metadatas, ids) in prepared.items():
+                    # Chunks left over from an earlier ingest, deleted once the
+                    # new chunks are stored
+                    stale_ids[name].extend(self._stale_chunk_ids(name, paper_key, ids))
+                    batches[name][0].extend(chunks)
+                    batches[name][1].extend(metadatas)
+                    batches[name][2].extend(ids)
+
+            fine_chunks, fine_metadatas, fine_ids = batches["fine"]
+            coarse_chunks, coarse_metadatas, coarse_ids = batches["coarse"]
             if not fine_chunks and not coarse_chunks:
                 return False
 
-            # Prepare metadata for fine chunks
-            fine_chunk_metadatas = []
-            for i, chunk in enumerate(fine_chunks):
-                chunk_metadata = paper_metadata.copy()
-                # Convert any list values to a string (e.g., authors)
-                for k, v in chunk_metadata.items():
-                    if isinstance(v, list):
-                        chunk_metadata[k] = ', '.join(str(x) for x in v)
-                chunk_metadata.update({
-                    'chunk_index': i,
-                    'total_chunks': len(fine_chunks),
-                    'chunk_length': len(chunk),
-                    'citation_key': citation_key,
-                    'bibtex': bibtex,
-                    'chunk_type': 'fine'
-                })
-                fine_chunk_metadatas.append(chunk_metadata)
-
-            # Prepare metadata for coarse chunks
-            coarse_chunk_metadatas = []
-            for i, chunk in enumerate(coarse_chunks):
-                chunk_metadata = paper_metadata.copy()
-                # Convert any list values to a string (e.g., authors)
-                for k, v in chunk_metadata.items():
-                    if isinstance(v, list):
-                        chunk_metadata[k] = ', '.join(str(x) for x in v)
-                chunk_metadata.update({
-                    'chunk_index': i,
-                    'total_chunks': len(coarse_chunks),
-                    'chunk_length': len(chunk),
-                    'citation_key': citation_key,
-                    'bibtex': bibtex,
-                    'chunk_type': 'coarse'
-                })
-                coarse_chunk_metadatas.append(chunk_metadata)
+            # Embed fine and coarse chunks together in one batched forward pass
+            all_embeddings = self.model.encode(
+                fine_chunks + coarse_chunks,
+                batch_size=64,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            ).tolist()
+            fine_embeddings = all_embeddings[:len(fine_chunks)]
+            coarse_embeddings = all_embeddings[len(fine_chunks):]
 
             # Add to both collections
-            fine_success = self.add_texts_to_collection(fine_chunks, fine_chunk_metadatas, "fine")
-            coarse_success = self.add_texts_to_collection(coarse_chunks, coarse_chunk_metadatas, "coarse")
+            fine_success = self.add_texts_to_collection(fine_chunks, fine_metadatas, "fine", fine_embeddings, fine_ids)
+            coarse_success = self.add_texts_to_collection(coarse_chunks, coarse_metadatas, "coarse", coarse_embeddings, coarse_ids)
+
+            # A failed upsert keeps the previous chunks rather than leaving none
+            for name, success in (("fine", fine_success), ("coarse", coarse_success)):
+                if success and stale_ids[name]:
+                    collection = self.fine_collection if name == "fine" else self.coarse_collection
+                    collection.delete(ids=stale_ids[name])
+                    logger.info(f"Deleted {len(stale_ids[name])} stale {name} chunks")
 
             return fine_success and coarse_success
 
         except Exception as e:
-            logger.error(f"Error ingesting paper: {e}")
+            logger.error(f"Error ingesting papers: {e}")
             return False
 
+    def _stale_chunk_ids(self, collection_name: str, paper_key: str, new_ids: List[str]) -> List[str]:
+        """
+        Ids of a paper's stored chunks that are not in new_ids.
+
+        The stored chunk count is read from the total_chunks metadata of the
+        paper's first chunk, so this must run before the new chunks are written.
+        """
+        collection = self.fine_collection if collection_name == "fine" else self.coarse_collection
+        first = collection.get(ids=[f"{paper_key}:{collection_name}:0"], include=["metadatas"])
+        if not first["ids"]:
+            return []
+        old_count = int((first["metadatas"][0] or {}).get("total_chunks", 0))
+        keep = set(new_ids)
+        return [chunk_id for chunk_id in (f"{paper_key}:{collection_name}:{i}" for i in range(old_count))
+                if chunk_id not in keep]
+
+    def _prepare_paper_chunks(self, text: str, paper_metadata: Dict[str, Any]) -> Tuple[str, Dict[str, Tuple[List[str], List[Dict[str, Any]], List[str]]]]:
+        """
+        Chunk a paper and build per-chunk metadata and ids.
+
+        Returns:
+            The paper key used in chunk ids, and a mapping of collection name
+            ("fine"/"coarse") to (chunks, metadatas, ids)
+        """
+        # Robust bibtex and citation_key generation using available metadata
+        citation_key = None
+        bibtex = None
+        title = paper_metadata.get('title', 'Unknown Title')
+        authors = paper_metadata.get('authors', ['Unknown'])
+        year = paper_metadata.get('year', 'xxxx')
+        arxiv_id = paper_metadata.get('arxiv_id', None)
+
+        # citation_key: firstauthorYYYYfirstwordoftitle or arxiv_id
+        if authors and authors[0] != 'Unknown' and year != 'xxxx' and title != 'Unknown Title':
+            first_author = authors[0].split()[-1]
+            first_word_title = title.split()[0].lower()
+            citation_key = f"{first_author.lower()}{year}{first_word_title}"
+        elif arxiv_id:
+            citation_key = arxiv_id
+        else:
+            citation_key = title.replace(' ', '_')[:20]
+
+        # bibtex
+        if arxiv_id:
+            bibtex = (
+                f"@article{{{citation_key},\n"
+                f"  title={{ {title} }},\n"
+                f"  author={{ {' and '.join(authors)} }},\n"
+                f"  year={{ {year} }},\n"
+                f"  eprint={{ {arxiv_id} }},\n"
+                f"  archivePrefix={{arXiv}},\n"
+                f"  url={{ https://arxiv.org/abs/{arxiv_id} }}\n"
+                f"}}"
+            )
+        else:
+            bibtex = (
+                f"@misc{{{citation_key},\n"
+                f"  title={{ {title} }},\n"
+                f"  author={{ {' and '.join(authors)} }},\n"
+                f"  year={{ {year} }},\n"
+                f"  url={{ {paper_metadata.get('url', '')} }}\n"
+                f"}}"
+            )
+
+        # Create fine chunks
+        fine_chunks = create_fine_chunks(
+            text, 
+            min_chars=FINE_CHUNK_MIN_CHARS,
+            max_chars=FINE_CHUNK_MAX_CHARS,
+            min_sentences=FINE_CHUNK_MIN_SENTENCES,
+            max_sentences=FINE_CHUNK_MAX_SENTENCES
+        )
+
+        # Create coarse chunks
+        coarse_chunks = create_coarse_chunks(
+            text,
+            min_chars=COARSE_CHUNK_MIN_CHARS,
+            max_chars=COARSE_CHUNK_MAX_CHARS,
+            min_tokens=COARSE_CHUNK_MIN_TOKENS,
+            max_tokens=COARSE_CHUNK_MAX_TOKENS
+        )
+
+        # Build the paper-level metadata once, converting any list values
+        # to a string (e.g., authors)
+        base_metadata = {
+            k: ', '.join(str(x) for x in v) if isinstance(v, list) else v
+            for k, v in paper_metadata.items()
+        }
+        base_metadata.update({
+            'citation_key': citation_key,
+            'bibtex': bibtex
+        })
+
+        # Prepare metadata for fine chunks
+        fine_chunk_metadatas = [
+            {
+                **base_metadata,
+                'chunk_index': i,
+                'total_chunks': len(fine_chunks),
+                'chunk_length': len(chunk),
+                'chunk_type': 'fine'
+            }
+            for i, chunk in enumerate(fine_chunks)
+        ]
+
+        # Prepare metadata for coarse chunks
+        coarse_chunk_metadatas = [
+            {
+                **base_metadata,
+                'chunk_index': i,
+                'total_chunks': len(coarse_chunks),
+                'chunk_length': len(chunk),
+                'chunk_type': 'coarse'
+            }
+            for i, chunk in enumerate(coarse_chunks)
+        ]
+
+        # Chunk ids come from the same metadata-derived scheme as
+        # add_texts_to_collection, so re-ingest is idempotent on every path
+        return _paper_key(base_metadata), {
+            "fine": (fine_chunks, fine_chunk_metadatas, [_chunk_id(md) for md in fine_chunk_metadatas]),
+            "coarse": (coarse_chunks, coarse_chunk_metadatas, [_chunk_id(md) for md in coarse_chunk_metadatas])
+        }
+
     def list_chunks_from_collection(self, collection_name: str = "fine") -> List[Dict[str, Any]]:
-        """List all chunks from a specific collection with embedding previews."""
+        """List all chunks from a specific collection with text previews."""
         try:
             collection = self.fine_collection if collection_name == "fine" else self.coarse_collection
             
-            results = collection.get(include=["documents", "metadatas", "embeddings"])
-
+            # Page through documents and metadata only; embeddings are the bulk
+            # of each record and are not needed for a listing
             chunks = []
-            for doc, meta, embedding in zip(results["documents"], results["metadatas"], results["embeddings"]):
-                chunk_info = {
-                    'text': doc[:200],
-                    'metadata': meta,
-                    'text_length': len(doc),
-                    'embedding_preview': embedding[:10],
-                    'collection': collection_name
-                }
-                chunks.append(chunk_info)
+            offset = 0
+            while True:
+                results = collection.get(
+                    include=["documents", "metadatas"],
+                    limit=LIST_CHUNKS_PAGE_SIZE,
+                    offset=offset
+                )
+                for doc, meta in zip(results["documents"], results["metadatas"]):
+                    chunk_info = {
+                        'text': doc[:200],
+                        'metadata': meta,
+                        'text_length': len(doc),
+                        'collection': collection_name
+                    }
+                    chunks.append(chunk_info)
+                if len(results["ids"]) < LIST_CHUNKS_PAGE_SIZE:
+                    break
+                offset += LIST_CHUNKS_PAGE_SIZE
             return chunks
 
         except Exception as e:
@@ -315,15 +552,13 @@ class VectorStoreService:
     def delete_all_chunks(self) -> bool:
         """Delete all chunks from both collections."""
         try:
-            # Delete from fine collection
-            fine_results = self.fine_collection.get()
-            if fine_results['ids']:
-                self.fine_collection.delete(ids=fine_results['ids'])
+            # Drop and recreate the collections rather than fetching every
+            # document and embedding just to learn their ids
+            self.client.delete_collection(FINE_CHUNKS_COLLECTION)
+            self.fine_collection = self._get_or_create_collection(FINE_CHUNKS_COLLECTION)
             
-            # Delete from coarse collection
-            coarse_results = self.coarse_collection.get()
-            if coarse_results['ids']:
-                self.coarse_collection.delete(ids=coarse_results['ids'])
+            self.client.delete_collection(COARSE_CHUNKS_COLLECTION)
+            self.coarse_collection = self._get_or_create_collection(COARSE_CHUNKS_COLLECTION)
                 
             return True
         except Exception as e:
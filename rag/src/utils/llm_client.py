@@ -1,15 +1,297 @@
 """
 LLM client utilities for the RAG server.
 """
-import requests
-import json
+import asyncio
+import httpx
+import itertools
 import logging
-from typing import Optional, List, Dict, Any
-from ..config import LLM_URL, LLM_TEMPERATURE, LLM_N_PREDICT, LLM_STOP_TOKENS
+import orjson
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Union, Iterator
+from ..config import (
+    LLM_URLS, LLM_TEMPERATURE, LLM_N_PREDICT, LLM_STOP_TOKENS, LLM_TIMEOUT_S,
+    SEMANTIC_QUERY_CACHE_SIZE, SEMANTIC_CACHE_PATH, SEMANTIC_CACHE_SIMILARITY, SEMANTIC_CACHE_MIN_JACCARD,
+    SEMANTIC_CACHE_MAX_ENTRIES, QUERY_REWRITE_MIN_WORDS, LLM_RETRY_TOTAL, LLM_RETRY_BACKOFF_S,
+    LLM_BREAKER_FAILURES, LLM_BREAKER_WINDOW_S, LLM_BREAKER_RESET_S
+)
+from .semantic_cache import SemanticQueryCache
 
 logger = logging.getLogger(__name__)
 
-def call_llm(prompt: str, temperature: Optional[float] = None, n_predict: Optional[int] = None) -> str:
+# Shared clients keep connections to the LLM server alive between calls
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+_HTTP_TIMEOUT = httpx.Timeout(LLM_TIMEOUT_S, connect=3.0)
+_client = httpx.AsyncClient(timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS,
+                            transport=httpx.AsyncHTTPTransport(retries=2, limits=_HTTP_LIMITS))
+_sync_client = httpx.Client(timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS,
+                            transport=httpx.HTTPTransport(retries=2, limits=_HTTP_LIMITS))
+
+# Invariant instructions are kept at the very start of prompts so the server
+# can reuse their KV cache across requests (cache_prompt)
+RAG_SYSTEM_PROMPT = """You are a research assistant that helps users understand and analyze academic papers.
+
+You are provided with:
+- A brief summary of the prior conversation.
+- A set of retrieved excerpts from a vector database of academic paper content.
+
+Your task is to use only the retrieved context to answer the latest user question in a formal academic tone. Do not rely on prior conversation unless it is reflected in the retrieved context. If the context is insufficient to answer the question, state that explicitly."""
+
+CHAT_SYSTEM_PROMPT = "You are a helpful research assistant. Use the provided context to answer questions accurately and comprehensively."
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when every LLM endpoint's circuit breaker is open."""
+
+class LLMResponseError(RuntimeError):
+    """Raised when the LLM server answers a streamed completion with an error status."""
+
+class _CircuitBreaker:
+    """
+    Stop sending requests to an endpoint after repeated failures.
+    
+    The breaker opens after `failure_threshold` failures within `window_s`
+    seconds. Once `reset_s` seconds have passed, a single probe request is let
+    through; a success closes the breaker, a failure keeps it open.
+    """
+
+    def __init__(self, url: str, failure_threshold: int, window_s: float, reset_s: float):
+        self.url = url
+        self.failure_threshold = failure_threshold
+        self.window_s = window_s
+        self.reset_s = reset_s
+        self._failures: deque = deque()
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """Whether allow() would let a request through, without using up a probe."""
+        with self._lock:
+            return self._opened_at is None or time.monotonic() - self._opened_at >= self.reset_s
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; call only for the endpoint actually used."""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self._opened_at >= self.reset_s:
+                # Half-open: let one probe through and wait again behind it
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures.clear()
+            if self._opened_at is not None:
+                logger.info(f"LLM endpoint {self.url} recovered, closing circuit breaker")
+                self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._failures.append(now)
+            while self._failures and now - self._failures[0] > self.window_s:
+                self._failures.popleft()
+            if self._opened_at is None and len(self._failures) >= self.failure_threshold:
+                # Logged once per trip rather than for every rejected request
+                logger.error(f"LLM endpoint {self.url} failed {len(self._failures)} times "
+                             f"in {self.window_s:.0f}s, opening circuit breaker")
+                self._opened_at = now
+
+# Requests are spread over LLM_URLS: round-robin, moving on to the following
+# endpoint when it is less busy and skipping endpoints whose breaker is open.
+# The cycle yields indices so each call advances it by exactly one endpoint
+_endpoint_cycle = itertools.cycle(range(len(LLM_URLS)))
+_endpoint_inflight: Counter = Counter()
+_endpoint_lock = threading.Lock()
+_breakers = {
+    url: _CircuitBreaker(url, LLM_BREAKER_FAILURES, LLM_BREAKER_WINDOW_S, LLM_BREAKER_RESET_S)
+    for url in LLM_URLS
+}
+
+@contextmanager
+def _llm_endpoint() -> Iterator[str]:
+    """Pick an LLM endpoint and count the request against it while it runs."""
+    with _endpoint_lock:
+        i = next(_endpoint_cycle)
+        candidates = [
+            u for u in dict.fromkeys((LLM_URLS[i], LLM_URLS[(i + 1) % len(LLM_URLS)]))
+            if _breakers[u].available()
+        ]
+        if not candidates:
+            candidates = [u for u in LLM_URLS if _breakers[u].available()]
+        # Ties go to the round-robin endpoint (the sort is stable), so idle
+        # traffic still rotates; only the endpoint actually used may take a
+        # half-open probe
+        url = next(
+            (u for u in sorted(candidates, key=lambda u: _endpoint_inflight[u]) if _breakers[u].allow()),
+            None
+        )
+        if url is None:
+            raise LLMUnavailableError("All LLM endpoints are unavailable")
+        _endpoint_inflight[url] += 1
+    try:
+        yield url
+    except httpx.HTTPError:
+        _breakers[url].record_failure()
+        raise
+    finally:
+        with _endpoint_lock:
+            _endpoint_inflight[url] -= 1
+
+def _record_status(url: str, status_code: int):
+    """Feed a response status into the endpoint's circuit breaker."""
+    if status_code >= 500:
+        _breakers[url].record_failure()
+    else:
+        _breakers[url].record_success()
+
+# Rewrites are reused for repeated and paraphrased questions
+_semantic_cache = SemanticQueryCache(
+    SEMANTIC_CACHE_PATH,
+    max_exact=SEMANTIC_QUERY_CACHE_SIZE,
+    similarity=SEMANTIC_CACHE_SIMILARITY,
+    min_jaccard=SEMANTIC_CACHE_MIN_JACCARD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES
+)
+
+# References that only make sense with conversation context
+_VAGUE_REFERENCE_RE = re.compile(
+    r"\b(?:this|that|these|those|it|its|they|them|the paper|the authors|above|previous)\b",
+    re.IGNORECASE
+)
+
+def _needs_rewrite(user_question: str) -> bool:
+    """Whether a question is too short or too vague to search with as-is."""
+    if len(user_question.split()) < QUERY_REWRITE_MIN_WORDS:
+        return True
+    return _VAGUE_REFERENCE_RE.search(user_question) is not None
+
+_SEMANTIC_QUERY_STOP = ["\nUser:", "\nAssistant:", "\n\n"]
+
+def _completion_payload(prompt: Union[str, List[str]], temperature: Optional[float], n_predict: Optional[int],
+                        stream: bool = False, stop: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Build the request body for a completion."""
+    return {
+        "prompt": prompt,
+        "temperature": temperature or LLM_TEMPERATURE,
+        "n_predict": n_predict or LLM_N_PREDICT,
+        "stream": stream,
+        "stop": stop or LLM_STOP_TOKENS,
+        "cache_prompt": True
+    }
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+_RETRY_STATUSES = frozenset({502, 503, 504})
+
+async def _post_json(url: str, payload: Dict[str, Any]) -> httpx.Response:
+    """
+    POST a JSON body serialized with orjson.
+    
+    Gateway errors are retried with exponential backoff.
+    """
+    body = orjson.dumps(payload)
+    for attempt in range(LLM_RETRY_TOTAL + 1):
+        response = await _client.post(url, content=body, headers=_JSON_HEADERS)
+        _record_status(url, response.status_code)
+        if response.status_code not in _RETRY_STATUSES or attempt == LLM_RETRY_TOTAL:
+            return response
+        await asyncio.sleep(LLM_RETRY_BACKOFF_S * (2 ** attempt))
+
+def _parse_completion(response: httpx.Response) -> str:
+    """Extract the completion text from an LLM response."""
+    if response.status_code == 200:
+        return orjson.loads(response.content).get("content", "")
+    logger.error(f"LLM request failed with status {response.status_code}")
+    return ""
+
+async def call_llm_stream(prompt: str, temperature: Optional[float] = None,
+                          n_predict: Optional[int] = None, stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+    """
+    Stream a completion from the LLM, yielding tokens as they arrive.
+    
+    Args:
+        prompt: The prompt to send to the LLM
+        temperature: Temperature for generation (optional)
+        n_predict: Number of tokens to predict (optional)
+        stop: Stop sequences (optional, defaults to LLM_STOP_TOKENS)
+        
+    Yields:
+        Generated text fragments in order
+        
+    Raises:
+        LLMUnavailableError: If every endpoint's circuit breaker is open
+        LLMResponseError: If the server answers with an error status
+    """
+    payload = _completion_payload(prompt, temperature, n_predict, stream=True, stop=stop)
+    with _llm_endpoint() as url:
+        async for content in _stream_completion(url, payload):
+            yield content
+
+async def _open_stream(url: str, payload: Dict[str, Any]) -> httpx.Response:
+    """
+    Send a streaming completion request and return the open response.
+    
+    Gateway errors are retried with exponential backoff before any content
+    has been read, like _post_json.
+    """
+    body = orjson.dumps(payload)
+    for attempt in range(LLM_RETRY_TOTAL + 1):
+        request = _client.build_request("POST", url, content=body, headers=_JSON_HEADERS)
+        response = await _client.send(request, stream=True)
+        _record_status(url, response.status_code)
+        if response.status_code not in _RETRY_STATUSES or attempt == LLM_RETRY_TOTAL:
+            return response
+        await response.aclose()
+        await asyncio.sleep(LLM_RETRY_BACKOFF_S * (2 ** attempt))
+
+async def _stream_completion(url: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yield content frames from a streaming completion request."""
+    response = await _open_stream(url, payload)
+    try:
+        if response.status_code != 200:
+            # Raise rather than end the stream, so callers don't mistake the
+            # failure for an empty answer
+            raise LLMResponseError(f"LLM stream request failed with status {response.status_code}")
+
+        # aiter_lines buffers partial lines across network chunks
+        async for line in response.aiter_lines():
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("data:"):
+                line = line[5:].strip()
+            if line == "[DONE]":
+                break
+
+            frame = orjson.loads(line)
+            content = frame.get("content", "")
+            if content:
+                yield content
+            if frame.get("stop", False):
+                break
+    finally:
+        await response.aclose()
+
+async def collect(stream: AsyncIterator[str]) -> str:
+    """
+    Drain a token stream into a single string.
+    
+    Args:
+        stream: Async iterator of text fragments
+        
+    Returns:
+        Concatenated text
+    """
+    return "".join([token async for token in stream])
+
+async def call_llm(prompt: str, temperature: Optional[float] = None, n_predict: Optional[int] = None,
+                   stop: Optional[List[str]] = None) -> str:
     """
     Call the LLM with a prompt and return the response.
     
@@ -17,33 +299,116 @@ def call_llm(prompt: str, temperature: Optional[float] = None, n_predict: Option
         prompt: The prompt to send to the LLM
         temperature: Temperature for generation (optional)
         n_predict: Number of tokens to predict (optional)
+        stop: Stop sequences (optional, defaults to LLM_STOP_TOKENS)
         
     Returns:
         LLM response as string
     """
     try:
-        response = requests.post(LLM_URL, json={
-            "prompt": prompt,
-            "temperature": temperature or LLM_TEMPERATURE,
-            "n_predict": n_predict or LLM_N_PREDICT,
-            "stream": False,
-            "stop": LLM_STOP_TOKENS
-        })
+        return await collect(call_llm_stream(prompt, temperature, n_predict, stop))
+            
+    except Exception as e:
+        logger.error(f"Error calling LLM: {str(e)}")
+        return ""
+
+async def call_llm_many(prompts: List[str], temperature: Optional[float] = None,
+                        n_predict: Optional[int] = None) -> List[str]:
+    """
+    Call the LLM with several independent prompts concurrently.
+    
+    Args:
+        prompts: Prompts to send to the LLM
+        temperature: Temperature for generation (optional)
+        n_predict: Number of tokens to predict (optional)
+        
+    Returns:
+        LLM responses in the same order as the prompts
+    """
+    return await asyncio.gather(*(call_llm(prompt, temperature, n_predict) for prompt in prompts))
+
+async def call_llm_batch(prompts: List[str], temperature: Optional[float] = None,
+                         n_predict: Optional[int] = None, stop: Optional[List[str]] = None) -> List[str]:
+    """
+    Complete several prompts in a single request to the LLM server.
+    
+    The server receives the prompts as one array so it can batch their prefill.
+    Backends that do not answer with one result per prompt are called once per
+    prompt instead.
+    
+    Args:
+        prompts: Prompts to send to the LLM
+        temperature: Temperature for generation (optional)
+        n_predict: Number of tokens to predict (optional)
+        stop: Stop sequences (optional, defaults to LLM_STOP_TOKENS)
         
+    Returns:
+        LLM responses in the same order as the prompts
+    """
+    if not prompts:
+        return []
+
+    try:
+        with _llm_endpoint() as url:
+            response = await _post_json(url, _completion_payload(prompts, temperature, n_predict, stop=stop))
         if response.status_code == 200:
-            return response.json().get("content", "")
-        else:
-            logger.error(f"LLM request failed with status {response.status_code}")
+            results = orjson.loads(response.content)
+            if isinstance(results, list) and len(results) == len(prompts):
+                return [result.get("content", "") for result in results]
+    except Exception as e:
+        logger.error(f"Error calling LLM with batched prompts: {str(e)}")
+
+    async def complete(prompt: str) -> str:
+        try:
+            with _llm_endpoint() as url:
+                response = await _post_json(url, _completion_payload(prompt, temperature, n_predict, stop=stop))
+            return _parse_completion(response)
+        except Exception as e:
+            logger.error(f"Error calling LLM: {str(e)}")
             return ""
+
+    return await asyncio.gather(*(complete(prompt) for prompt in prompts))
+
+def call_llm_sync(prompt: str, temperature: Optional[float] = None, n_predict: Optional[int] = None,
+                  stop: Optional[List[str]] = None) -> str:
+    """
+    Blocking variant of call_llm for callers outside an event loop.
+    
+    Args:
+        prompt: The prompt to send to the LLM
+        temperature: Temperature for generation (optional)
+        n_predict: Number of tokens to predict (optional)
+        stop: Stop sequences (optional, defaults to LLM_STOP_TOKENS)
+        
+    Returns:
+        LLM response as string
+    """
+    try:
+        with _llm_endpoint() as url:
+            response = _sync_client.post(url, content=orjson.dumps(_completion_payload(prompt, temperature, n_predict, stop=stop)),
+                                         headers=_JSON_HEADERS)
+            _record_status(url, response.status_code)
+        return _parse_completion(response)
             
     except Exception as e:
         logger.error(f"Error calling LLM: {str(e)}")
         return ""
 
-def create_semantic_query(user_question: str) -> str:
+def set_semantic_query_encoder(encoder: Callable[[List[str]], List[List[float]]]):
+    """
+    Enable the similarity tier of the semantic query cache.
+    
+    Args:
+        encoder: Function embedding a list of texts
+    """
+    _semantic_cache.encoder = encoder
+
+async def create_semantic_query(user_question: str) -> str:
     """
-    Use LLM to rewrite a user question into a clear, specific, and semantically rich query
-    suitable for embedding and similarity-based retrieval.
+    Rewrite user question into a semantic search query.
+    
+    Specific, self-contained questions are used as-is, and identical questions
+    and close paraphrases are answered from the semantic query cache, all
+    without calling the LLM.
     
     Args:
         user_question: Original user question
@@ -51,7 +416,103 @@ def create_semantic_query(user_question: str) -> str:
     Returns:
         Rewritten semantic query
     """
-    prompt = f"""You are a research assistant helping users retrieve the most relevant content from a vector database of academic paper chunks.
+    if not _needs_rewrite(user_question):
+        return user_question
+
+    cached = _semantic_cache.get_exact(user_question)
+    if cached is not None:
+        return cached
+
+    try:
+        embedding = await asyncio.to_thread(_semantic_cache.embed, user_question)
+    except Exception as e:
+        logger.error(f"Error embedding question for semantic cache: {e}")
+        embedding = None
+
+    try:
+        cached = _semantic_cache.get_similar(user_question, embedding)
+        if cached is not None:
+            return cached
+
+        rewritten_query = await _rewrite_semantic_query(user_question)
+        
+        # Fallback to original query if LLM call fails or returns empty
+        if not rewritten_query:
+            return user_question
+
+        # Persisting the entry writes to disk, so keep it off the event loop
+        await asyncio.to_thread(_semantic_cache.put, user_question, rewritten_query, embedding)
+        return rewritten_query
+    except Exception as e:
+        # Fallback to original query if there's an error
+        logger.error(f"Error creating semantic query: {e}")
+        return user_question
+
+async def create_semantic_query_batch(user_questions: List[str]) -> List[str]:
+    """
+    Rewrite several user questions into semantic search queries.
+    
+    Self-contained and cached questions are answered locally; the rest are
+    rewritten in one batched LLM request.
+    
+    Args:
+        user_questions: Original user questions
+        
+    Returns:
+        Rewritten semantic queries in the same order as the questions
+    """
+    rewritten: List[Optional[str]] = [
+        _semantic_cache.get_exact(q) if _needs_rewrite(q) else q
+        for q in user_questions
+    ]
+    misses = [i for i, query in enumerate(rewritten) if query is None]
+    if not misses:
+        return rewritten
+
+    try:
+        embeddings = await asyncio.to_thread(
+            lambda: [_semantic_cache.embed(user_questions[i]) for i in misses]
+        )
+    except Exception as e:
+        logger.error(f"Error embedding questions for semantic cache: {e}")
+        embeddings = [None] * len(misses)
+
+    pending = []
+    for i, embedding in zip(misses, embeddings):
+        try:
+            rewritten[i] = _semantic_cache.get_similar(user_questions[i], embedding)
+        except Exception as e:
+            logger.error(f"Error looking up semantic query cache: {e}")
+        if rewritten[i] is None:
+            pending.append((i, embedding))
+
+    if pending:
+        responses = await call_llm_batch(
+            [_semantic_query_prompt(user_questions[i]) for i, _ in pending],
+            temperature=0.3,  # Lower temperature for more consistent query rewriting
+            n_predict=100,
+            stop=_SEMANTIC_QUERY_STOP
+        )
+        fresh = []
+        for (i, embedding), response in zip(pending, responses):
+            query = response.strip()
+            if query:
+                fresh.append((user_questions[i], query, embedding))
+                rewritten[i] = query
+            else:
+                # Fallback to original query if LLM call fails or returns empty
+                rewritten[i] = user_questions[i]
+        try:
+            # Persisting entries writes to disk, so keep it off the event loop
+            await asyncio.to_thread(lambda: [_semantic_cache.put(*entry) for entry in fresh])
+        except Exception as e:
+            logger.error(f"Error storing semantic query cache entries: {e}")
+
+    return rewritten
+
+def _semantic_query_prompt(user_question: str) -> str:
+    """Prompt asking the LLM to rewrite a question into a search query."""
+    return f"""You are a research assistant helping users retrieve the most relevant content from a vector database of academic paper chunks.
 
 Given a user question, rewrite it into a clear, specific, and semantically rich query suitable for embedding and similarity-based retrieval.
 
@@ -65,25 +526,41 @@ User Question:
 
 Rewritten Semantic Search Query:"""
 
-    try:
-        response = requests.post(LLM_URL, json={
-            "prompt": prompt,
+async def _rewrite_semantic_query(user_question: str) -> str:
+    """Ask the LLM to rewrite a question into a search query."""
+    with _llm_endpoint() as url:
+        response = await _post_json(url, {
+            "prompt": _semantic_query_prompt(user_question),
             "temperature": 0.3,  # Lower temperature for more consistent query rewriting
             "n_predict": 100,
             "stream": False,
-            "stop": ["\nUser:", "\nAssistant:", "\n\n"]
+            "stop": _SEMANTIC_QUERY_STOP,
+            "cache_prompt": True
         })
-        rewritten_query = response.json().get("content", "").strip()
-        
-        # Fallback to original query if LLM call fails or returns empty
-        if not rewritten_query:
-            return user_question
-            
-        return rewritten_query
-    except Exception as e:
-        # Fallback to original query if there's an error
-        logger.error(f"Error creating semantic query: {e}")
-        return user_question
+    return orjson.loads(response.content).get("content", "").strip()
+
+# Prompt layouts filled by build_prompt and build_rag_prompt
+PROMPT_TEMPLATE = "{system}\n\n{context}\n\n{history}\n\n{query}\n"
+
+RAG_PROMPT_TEMPLATE = RAG_SYSTEM_PROMPT + """
+
+---
+
+Chat Summary:
+{chat_summary}
+
+---
+
+Context:
+{context_chunks}
+
+---
+
+{user_question}
+"""
+
+# Number of most recent chat turns included by build_prompt
+PROMPT_HISTORY_TURNS = 2
 
 def build_prompt(system: str, context: str, history: List[Dict[str, str]], query: str) -> str:
     """
@@ -99,11 +576,14 @@ def build_prompt(system: str, context: str, history: List[Dict[str, str]], query
         Formatted prompt string
     """
     # Convert history to text format
-    history_text = "\n\n".join(
-        f"{turn['user']}\n{turn['assistant']}" for turn in history[-2:]
-    )
+    history_text = "\n\n".join([f"{turn['user']}\n{turn['assistant']}" for turn in history[-PROMPT_HISTORY_TURNS:]])
 
-    return f"""{system}\n\n{context}\n\n{history_text}\n\n{query}\n"""
+    return PROMPT_TEMPLATE.format_map({
+        "system": system,
+        "context": context,
+        "history": history_text,
+        "query": query
+    })
 
 def build_rag_prompt(chat_summary: str, context_chunks: str, user_question: str) -> str:
     """
@@ -117,25 +597,8 @@ def build_rag_prompt(chat_summary: str, context_chunks: str, user_question: str)
     Returns:
         Formatted RAG prompt
     """
-    return f"""You are a research assistant that helps users understand and analyze academic papers.
-
-You are provided with:
-- A brief summary of the prior conversation.
-- A set of retrieved excerpts from a vector database of academic paper content.
-
-Your task is to use only the retrieved context to answer the latest user question in a formal academic tone. Do not rely on prior conversation unless it is reflected in the retrieved context. If the context is insufficient to answer the question, state that explicitly.
-
----
-
-Chat Summary:
-{chat_summary}
-
----
-
-Context:
-{context_chunks}
-
----
-
-{user_question}
-""" 
\ No newline at end of file
+    return RAG_PROMPT_TEMPLATE.format_map({
+        "chat_summary": chat_summary,
+        "context_chunks": context_chunks,
+        "user_question": user_question
+    })
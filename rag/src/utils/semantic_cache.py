@@ -0,0 +1,224 @@
+"""
+Two-tier cache for LLM query rewrites: exact match first, then embedding similarity.
+"""
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "how", "i", "in", "is", "it", "me", "of", "on", "or", "paper", "tell",
+    "that", "the", "this", "to", "was", "what", "when", "where", "which", "who",
+    "why", "with", "you"
+})
+
+def _content_tokens(text: str) -> frozenset:
+    """Lowercased non-stopword tokens of a question."""
+    return frozenset(t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS)
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    """Jaccard overlap of two token sets (1.0 when both are empty)."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class SemanticQueryCache:
+    """
+    Cache mapping user questions to rewritten search queries.
+
+    Exact repeats are served from an in-memory LRU. Paraphrases are served when
+    the question's embedding is within `similarity` (cosine) of a cached one and
+    its content words overlap by at least `min_jaccard`, which keeps near-identical
+    but meaningfully different questions (e.g. "CPC" vs "CPM") apart. Entries are
+    appended to a JSONL file so the semantic tier survives restarts.
+
+    The semantic tier keeps at most `max_entries` rows, overwriting the oldest
+    once full, and the file is compacted when it grows past twice that size.
+    Embeddings of a different dimension than the current encoder's (e.g. after
+    changing the embedding model) are discarded.
+    """
+
+    def __init__(self, path: str, max_exact: int = 4096, similarity: float = 0.95,
+                 min_jaccard: float = 0.7, max_entries: int = 10000):
+        self.path = os.path.expanduser(path)
+        self.max_exact = max_exact
+        self.similarity = similarity
+        self.min_jaccard = min_jaccard
+        self.max_entries = max_entries
+        self.encoder: Optional[Callable[[List[str]], List[List[float]]]] = None
+
+        self._exact: "OrderedDict[str, str]" = OrderedDict()
+        # Semantic tier: a ring buffer of rows in a preallocated matrix
+        self._questions: List[str] = []
+        self._tokens: List[frozenset] = []
+        self._rewrites: List[str] = []
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        self._next = 0
+        self._file_lines = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        """Load persisted semantic entries, skipping unreadable lines and stale dimensions."""
+        if not os.path.exists(self.path):
+            return
+        entries = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        entry = json.loads(line)
+                        entries.append((entry["question"], entry["rewrite"], entry["embedding"]))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except Exception as e:
+            logger.error(f"Error loading semantic query cache from {self.path}: {e}")
+            return
+
+        if not entries:
+            return
+        # Entries written before an embedding model change have another dimension;
+        # keep those matching the most recent entry
+        dim = len(entries[-1][2])
+        kept = [entry for entry in entries if len(entry[2]) == dim][-self.max_entries:]
+        if len(kept) < len(entries):
+            logger.warning(f"Discarded {len(entries) - len(kept)} semantic query cache entries "
+                           f"with a different embedding dimension or over the size limit")
+        for question, rewrite, embedding in kept:
+            self._append_row(question, rewrite, self._normalize(embedding))
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        """Embed a question with the configured encoder, or None if there is none."""
+        if self.encoder is None:
+            return None
+        return self._normalize(self.encoder([question])[0])
+
+    def get_exact(self, question: str) -> Optional[str]:
+        """Return the cached rewrite for an identical question."""
+        with self._lock:
+            rewrite = self._exact.get(question)
+            if rewrite is not None:
+                self._exact.move_to_end(question)
+            return rewrite
+
+    def get_similar(self, question: str, embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Return the rewrite of the nearest cached paraphrase, if close enough."""
+        if embedding is None:
+            return None
+        with self._lock:
+            if not self._size or not self._check_dimension(embedding):
+                return None
+            scores = self._matrix[:self._size] @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity:
+                return None
+            if _jaccard(_content_tokens(question), self._tokens[best]) < self.min_jaccard:
+                return None
+            rewrite = self._rewrites[best]
+        self._remember_exact(question, rewrite)
+        return rewrite
+
+    def _check_dimension(self, embedding: np.ndarray) -> bool:
+        """
+        Whether an embedding matches the semantic tier's dimension.
+
+        On a mismatch the encoder has changed, so the in-memory tier is dropped
+        and rebuilt from new entries. Call with the lock held.
+        """
+        if self._matrix is None or self._matrix.shape[1] == embedding.shape[0]:
+            return True
+        logger.warning(f"Embedding dimension changed from {self._matrix.shape[1]} to "
+                       f"{embedding.shape[0]}, clearing the semantic query cache")
+        self._questions, self._tokens, self._rewrites = [], [], []
+        self._matrix = None
+        self._size = self._next = 0
+        return False
+
+    def _append_row(self, question: str, rewrite: str, embedding: np.ndarray):
+        """Store a row in the semantic tier, overwriting the oldest once full. Call with the lock held."""
+        if self._matrix is None:
+            self._matrix = np.empty((min(64, self.max_entries), embedding.shape[0]), dtype=np.float32)
+        elif self._size == len(self._matrix) and self._size < self.max_entries:
+            # Grow geometrically so inserts don't copy the whole matrix each time
+            grown = np.empty((min(2 * self._size, self.max_entries), self._matrix.shape[1]), dtype=np.float32)
+            grown[:self._size] = self._matrix
+            self._matrix = grown
+
+        slot = self._next
+        self._matrix[slot] = embedding
+        if slot == len(self._rewrites):
+            self._questions.append(question)
+            self._tokens.append(_content_tokens(question))
+            self._rewrites.append(rewrite)
+        else:
+            self._questions[slot] = question
+            self._tokens[slot] = _content_tokens(question)
+            self._rewrites[slot] = rewrite
+        self._size = max(self._size, slot + 1)
+        self._next = (slot + 1) % self.max_entries
+
+    def _remember_exact(self, question: str, rewrite: str):
+        with self._lock:
+            self._exact[question] = rewrite
+            self._exact.move_to_end(question)
+            while len(self._exact) > self.max_exact:
+                self._exact.popitem(last=False)
+
+    def put(self, question: str, rewrite: str, embedding: Optional[np.ndarray]):
+        """
+        Store a fresh rewrite in both tiers and persist it.
+
+        This writes to disk, so async callers should run it in a worker thread.
+        """
+        self._remember_exact(question, rewrite)
+        if embedding is None:
+            return
+        with self._lock:
+            self._check_dimension(embedding)
+            self._append_row(question, rewrite, embedding)
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                if self._file_lines >= 2 * self.max_entries:
+                    self._compact()
+                else:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(self._entry_line(question, rewrite, embedding))
+                    self._file_lines += 1
+            except Exception as e:
+                logger.error(f"Error persisting semantic query cache entry: {e}")
+
+    @staticmethod
+    def _entry_line(question: str, rewrite: str, embedding: np.ndarray) -> str:
+        return json.dumps({
+            "question": question,
+            "rewrite": rewrite,
+            "embedding": embedding.tolist()
+        }) + "\n"
+
+    def _compact(self):
+        """Rewrite the cache file with only the live entries, oldest first. Call with the lock held."""
+        order = list(range(self._next, self._size)) + list(range(self._next))
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for slot in order:
+                f.write(self._entry_line(self._questions[slot], self._rewrites[slot], self._matrix[slot]))
+        os.replace(tmp_path, self.path)
+        self._file_lines = len(order)
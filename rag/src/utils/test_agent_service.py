@@ -0,0 +1,57 @@
+"""
+Unit tests for the agent service module.
+"""
+import importlib
+import importlib.util
+import unittest
+from unittest.mock import AsyncMock, patch
+
+HAS_AGENT_DEPS = importlib.util.find_spec("langchain") is not None
+
+@unittest.skipUnless(HAS_AGENT_DEPS, "langchain is required")
+class TestAgentServiceModule(unittest.TestCase):
+
+    def test_module_imports(self):
+        """The module imports cleanly, since the API routes depend on it."""
+        agent_service = importlib.import_module("..services.agent_service", __package__)
+        self.assertTrue(callable(agent_service.get_agent_service))
+        self.assertTrue(callable(agent_service.get_agent_service.cache_clear))
+
+class FakeVectorStore:
+    """Records the queries it is searched with."""
+
+    def __init__(self):
+        self.queries = []
+
+    def search_collection(self, queries, k, collection_name):
+        self.queries.append(queries)
+        return {"results": [{"text": "chunk"}]}
+
+@unittest.skipUnless(HAS_AGENT_DEPS, "langchain is required")
+class TestToolExecution(unittest.IsolatedAsyncioTestCase):
+
+    async def test_rag_search_rewrites_the_query(self):
+        """Tool execution requests search with the original and rewritten queries."""
+        agent_service = importlib.import_module("..services.agent_service", __package__)
+        tool = agent_service.RAGSearchTool()
+        tool.vector_store = FakeVectorStore()
+        service = agent_service.AgentService.__new__(agent_service.AgentService)
+        service.tools = [tool]
+        with patch.object(agent_service, "create_semantic_query", AsyncMock(return_value="rewritten")):
+            result = await service.handle_tool_execution("rag_search", {"query": "what is it", "k": 2})
+        self.assertIn("chunk", result)
+        self.assertEqual(tool.vector_store.queries, [["what is it", "rewritten"]])
+
+    async def test_chat_model_uses_the_shared_client(self):
+        """The agent's chat model sends completions through llm_client."""
+        agent_service = importlib.import_module("..services.agent_service", __package__)
+        llm = agent_service.LlamaCppChat()
+        call_llm = AsyncMock(return_value="hello")
+        with patch.object(agent_service, "call_llm", call_llm):
+            response = await llm.ainvoke([agent_service.HumanMessage(content="hi")])
+        self.assertEqual(response.content, "hello")
+        prompt = call_llm.call_args.args[0]
+        self.assertTrue(prompt.endswith("User: hi\nAssistant: "))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""
+Unit tests for the LLM client's circuit breaker and gateway retries.
+"""
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from . import llm_client
+from .llm_client import _CircuitBreaker
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def make_breaker(self):
+        return _CircuitBreaker("http://llm", failure_threshold=3, window_s=10, reset_s=30)
+
+    def test_opens_after_threshold(self):
+        """The breaker stays closed below the threshold and opens at it."""
+        breaker = self.make_breaker()
+        with patch.object(llm_client.time, "monotonic", return_value=100.0):
+            breaker.record_failure()
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertFalse(breaker.available())
+            self.assertFalse(breaker.allow())
+
+    def test_failures_outside_window_are_forgotten(self):
+        """Failures older than the window do not count towards opening."""
+        breaker = self.make_breaker()
+        with patch.object(llm_client.time, "monotonic", return_value=100.0):
+            breaker.record_failure()
+            breaker.record_failure()
+        with patch.object(llm_client.time, "monotonic", return_value=200.0):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        """After the reset delay one probe is allowed; success closes the breaker."""
+        breaker = self.make_breaker()
+        with patch.object(llm_client.time, "monotonic", return_value=100.0):
+            for _ in range(3):
+                breaker.record_failure()
+        with patch.object(llm_client.time, "monotonic", return_value=131.0):
+            # Checking availability does not use up the probe
+            self.assertTrue(breaker.available())
+            self.assertTrue(breaker.available())
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+            self.assertTrue(breaker.allow())
+
+    def test_failed_probe_keeps_breaker_open(self):
+        """A failing probe keeps the breaker open for another reset delay."""
+        breaker = self.make_breaker()
+        with patch.object(llm_client.time, "monotonic", return_value=100.0):
+            for _ in range(3):
+                breaker.record_failure()
+        with patch.object(llm_client.time, "monotonic", return_value=131.0):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        with patch.object(llm_client.time, "monotonic", return_value=150.0):
+            self.assertFalse(breaker.allow())
+        with patch.object(llm_client.time, "monotonic", return_value=162.0):
+            self.assertTrue(breaker.allow())
+
+    def test_endpoint_selection_probes_only_the_chosen_endpoint(self):
+        """Picking an endpoint does not consume probes of endpoints it skips."""
+        urls = ["http://a", "http://b"]
+        breakers = {url: _CircuitBreaker(url, 1, 10, 30) for url in urls}
+        with patch.object(llm_client.time, "monotonic", return_value=100.0):
+            for breaker in breakers.values():
+                breaker.record_failure()
+        with patch.object(llm_client, "LLM_URLS", urls), \
+                patch.object(llm_client, "_breakers", breakers), \
+                patch.object(llm_client, "_endpoint_cycle", iter([0, 1])), \
+                patch.object(llm_client.time, "monotonic", return_value=131.0):
+            with llm_client._llm_endpoint() as url:
+                chosen = url
+            skipped = "http://b" if chosen == "http://a" else "http://a"
+            self.assertTrue(breakers[skipped].allow())
+            self.assertFalse(breakers[chosen].allow())
+
+    def test_idle_endpoints_rotate(self):
+        """With nothing in flight, consecutive calls use every endpoint in turn."""
+        urls = ["http://a", "http://b", "http://c", "http://d"]
+        breakers = {url: _CircuitBreaker(url, 3, 10, 30) for url in urls}
+        with patch.object(llm_client, "LLM_URLS", urls), \
+                patch.object(llm_client, "_breakers", breakers), \
+                patch.object(llm_client, "_endpoint_cycle", llm_client.itertools.cycle(range(len(urls)))):
+            chosen = []
+            for _ in range(8):
+                with llm_client._llm_endpoint() as url:
+                    chosen.append(url)
+        self.assertEqual(chosen, urls * 2)
+
+    def test_busy_endpoint_hands_over_to_the_next(self):
+        """A busy round-robin endpoint defers to the following idle one."""
+        urls = ["http://a", "http://b"]
+        breakers = {url: _CircuitBreaker(url, 3, 10, 30) for url in urls}
+        with patch.object(llm_client, "LLM_URLS", urls), \
+                patch.object(llm_client, "_breakers", breakers), \
+                patch.object(llm_client, "_endpoint_cycle", iter([0, 0])):
+            with llm_client._llm_endpoint() as first:
+                with llm_client._llm_endpoint() as second:
+                    self.assertEqual((first, second), ("http://a", "http://b"))
+
+class TestGatewayRetry(unittest.IsolatedAsyncioTestCase):
+
+    def make_client(self, statuses):
+        """AsyncClient answering with the given statuses in order, then 200."""
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            status = statuses[len(calls) - 1] if len(calls) <= len(statuses) else 200
+            if status != 200:
+                return httpx.Response(status)
+            if b'"stream":true' in request.content:
+                return httpx.Response(200, content=b'data: {"content": "ok", "stop": true}\n\n')
+            return httpx.Response(200, json={"content": "ok"})
+
+        return httpx.AsyncClient(transport=httpx.MockTransport(handler)), calls
+
+    async def test_post_json_retries_gateway_errors(self):
+        """502/503 responses are retried until a success."""
+        client, calls = self.make_client([502, 503])
+        with patch.object(llm_client, "_client", client), \
+                patch.object(llm_client, "LLM_RETRY_BACKOFF_S", 0), \
+                patch.object(llm_client, "_record_status"):
+            response = await llm_client._post_json("http://llm", {"prompt": "hi"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 3)
+
+    async def test_post_json_gives_up_after_retry_total(self):
+        """The last gateway error is returned once retries are exhausted."""
+        client, calls = self.make_client([504] * 10)
+        with patch.object(llm_client, "_client", client), \
+                patch.object(llm_client, "LLM_RETRY_BACKOFF_S", 0), \
+                patch.object(llm_client, "LLM_RETRY_TOTAL", 2), \
+                patch.object(llm_client, "_record_status"):
+            response = await llm_client._post_json("http://llm", {"prompt": "hi"})
+        self.assertEqual(response.status_code, 504)
+        self.assertEqual(len(calls), 3)
+
+    async def test_post_json_does_not_retry_other_errors(self):
+        """Non-gateway errors are returned immediately."""
+        client, calls = self.make_client([500])
+        with patch.object(llm_client, "_client", client), \
+                patch.object(llm_client, "LLM_RETRY_BACKOFF_S", 0), \
+                patch.object(llm_client, "_record_status"):
+            response = await llm_client._post_json("http://llm", {"prompt": "hi"})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(calls), 1)
+
+    async def test_stream_retries_gateway_errors(self):
+        """A streamed completion retries gateway errors before yielding."""
+        client, calls = self.make_client([503])
+        payload = llm_client._completion_payload("hi", None, None, stream=True)
+        with patch.object(llm_client, "_client", client), \
+                patch.object(llm_client, "LLM_RETRY_BACKOFF_S", 0), \
+                patch.object(llm_client, "_record_status"):
+            text = await llm_client.collect(llm_client._stream_completion("http://llm", payload))
+        self.assertEqual(text, "ok")
+        self.assertEqual(len(calls), 2)
+
+    async def test_stream_raises_on_error_status(self):
+        """A failed streamed completion raises instead of ending with no content."""
+        client, calls = self.make_client([500])
+        payload = llm_client._completion_payload("hi", None, None, stream=True)
+        with patch.object(llm_client, "_client", client), \
+                patch.object(llm_client, "_record_status"):
+            with self.assertRaises(llm_client.LLMResponseError):
+                await llm_client.collect(llm_client._stream_completion("http://llm", payload))
+
+if __name__ == '__main__':
+    unittest.main()
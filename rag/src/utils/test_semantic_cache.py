@@ -0,0 +1,125 @@
+"""
+Unit tests for the semantic query cache.
+"""
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from .semantic_cache import SemanticQueryCache
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+class TestSemanticQueryCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "semq.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_cache(self, **kwargs):
+        return SemanticQueryCache(self.path, **kwargs)
+
+    def test_exact_match(self):
+        """Identical questions are served from the exact tier."""
+        cache = self.make_cache()
+        cache.put("what is attention", "attention mechanism", None)
+        self.assertEqual(cache.get_exact("what is attention"), "attention mechanism")
+        self.assertIsNone(cache.get_exact("what is memory"))
+
+    def test_exact_tier_is_bounded(self):
+        """The exact tier evicts the least recently used question."""
+        cache = self.make_cache(max_exact=2)
+        cache.put("q1", "r1", None)
+        cache.put("q2", "r2", None)
+        cache.get_exact("q1")
+        cache.put("q3", "r3", None)
+        self.assertEqual(cache.get_exact("q1"), "r1")
+        self.assertIsNone(cache.get_exact("q2"))
+
+    def test_similar_match(self):
+        """Close paraphrases with overlapping content words are served."""
+        cache = self.make_cache()
+        cache.put("explain transformer attention", "transformer attention", unit(1, 0, 0))
+        rewrite = cache.get_similar("explain the transformer attention", unit(1, 0.01, 0))
+        self.assertEqual(rewrite, "transformer attention")
+        # The paraphrase is now also an exact hit
+        self.assertEqual(cache.get_exact("explain the transformer attention"), "transformer attention")
+
+    def test_similar_rejects_distant_embedding(self):
+        """Questions whose embeddings are not close enough miss."""
+        cache = self.make_cache()
+        cache.put("explain transformer attention", "transformer attention", unit(1, 0, 0))
+        self.assertIsNone(cache.get_similar("explain transformer attention", unit(0, 1, 0)))
+
+    def test_similar_rejects_low_word_overlap(self):
+        """Near-identical embeddings with different content words miss."""
+        cache = self.make_cache()
+        cache.put("what is cpc", "cost per click", unit(1, 0, 0))
+        self.assertIsNone(cache.get_similar("what is cpm", unit(1, 0, 0)))
+
+    def test_entries_survive_reload(self):
+        """Semantic entries are persisted and reloaded."""
+        self.make_cache().put("explain transformer attention", "transformer attention", unit(1, 0, 0))
+        cache = self.make_cache()
+        self.assertEqual(cache.get_similar("explain transformer attention", unit(1, 0, 0)),
+                         "transformer attention")
+
+    def test_load_discards_mismatched_dimensions(self):
+        """Rows with another dimension than the latest entry are skipped on load."""
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"question": "old question", "rewrite": "old", "embedding": [1.0, 0.0]}) + "\n")
+            f.write("not json\n")
+            f.write(json.dumps({"question": "new question", "rewrite": "new", "embedding": [1.0, 0.0, 0.0]}) + "\n")
+        cache = self.make_cache()
+        self.assertEqual(cache._size, 1)
+        self.assertEqual(cache.get_similar("new question", unit(1, 0, 0)), "new")
+
+    def test_query_with_mismatched_dimension_misses(self):
+        """A query embedding of another dimension misses instead of raising."""
+        cache = self.make_cache()
+        cache.put("explain transformer attention", "transformer attention", unit(1, 0, 0))
+        self.assertIsNone(cache.get_similar("explain transformer attention", unit(1, 0)))
+        # The tier is rebuilt with the new dimension
+        cache.put("explain transformer attention", "transformer attention", unit(1, 0))
+        self.assertEqual(cache.get_similar("explain transformer attention", unit(1, 0)),
+                         "transformer attention")
+
+    def test_oldest_entries_are_overwritten(self):
+        """Once full, new entries replace the oldest ones."""
+        cache = self.make_cache(max_entries=2)
+        cache.put("alpha topic", "alpha", unit(1, 0, 0))
+        cache.put("beta topic", "beta", unit(0, 1, 0))
+        cache.put("gamma topic", "gamma", unit(0, 0, 1))
+        self.assertEqual(cache._size, 2)
+        self.assertIsNone(cache.get_similar("alpha topic", unit(1, 0, 0)))
+        self.assertEqual(cache.get_similar("beta topic", unit(0, 1, 0)), "beta")
+        self.assertEqual(cache.get_similar("gamma topic", unit(0, 0, 1)), "gamma")
+
+    def test_matrix_grows_in_chunks(self):
+        """The embedding matrix is preallocated rather than grown per insert."""
+        cache = self.make_cache()
+        for i in range(70):
+            cache.put(f"question {i}", f"rewrite {i}", unit(1, i, 0))
+        self.assertEqual(cache._size, 70)
+        self.assertEqual(len(cache._matrix), 128)
+
+    def test_file_is_compacted(self):
+        """The cache file is rewritten with live entries once it grows too large."""
+        cache = self.make_cache(max_entries=2)
+        for i in range(6):
+            cache.put(f"question {i}", f"rewrite {i}", unit(1, i, 0))
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.readlines()
+        self.assertLessEqual(len(lines), 4)
+        reloaded = self.make_cache(max_entries=2)
+        self.assertEqual(sorted(reloaded._rewrites), ["rewrite 4", "rewrite 5"])
+
+if __name__ == '__main__':
+    unittest.main()
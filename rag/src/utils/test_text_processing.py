@@ -2,14 +2,24 @@
 Unit tests for text processing utilities.
 """
 import unittest
-from unittest.mock import patch
 from .text_processing import (
     preprocess_text, count_tokens, is_section_header, is_semantic_break,
     split_into_sections, split_into_paragraphs, merge_paragraphs_semantically,
     apply_overlap_sliding_window, advanced_chunk_by_structure, ChunkingConfig,
-    chunk_by_paragraphs, extract_arxiv_id
+    chunk_by_paragraphs, extract_arxiv_id, chunk_text_with_overlap, iter_chunks_with_overlap
 )
-import re
+
+def reference_overlap_chunks(text, max_length, overlap):
+    """The original loop-based overlap chunking, for comparison."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_length, len(text))
+        chunks.append(text[start:end])
+        if end == len(text):
+            break
+        start = max(end - overlap, 0)
+    return chunks
 
 class TestTextProcessing(unittest.TestCase):
     
@@ -238,5 +248,41 @@ This is related work.
         self.assertIn("test document", processed)
         self.assertIn("multiple pages", processed)
 
+class TestChunkTextWithOverlap(unittest.TestCase):
+
+    def test_empty_text(self):
+        """Empty text yields no chunks."""
+        self.assertEqual(chunk_text_with_overlap("", 10, 2), [])
+        self.assertEqual(list(iter_chunks_with_overlap("", 10, 2)), [])
+
+    def test_short_text_is_one_chunk(self):
+        """Text that fits in one window is returned whole, whatever the overlap."""
+        self.assertEqual(chunk_text_with_overlap("short", 100, 200), ["short"])
+        self.assertEqual(chunk_text_with_overlap("short", 5, 5), ["short"])
+        self.assertEqual(list(iter_chunks_with_overlap("short", 100, 200)), ["short"])
+
+    def test_matches_reference(self):
+        """Chunks match the original loop for a range of lengths and overlaps."""
+        text = "".join(chr(ord("a") + i % 26) for i in range(103))
+        for length in (1, 9, 10, 11, 50, 103):
+            for max_length in (1, 3, 10, 25, 103, 200):
+                for overlap in range(0, max_length):
+                    expected = reference_overlap_chunks(text[:length], max_length, overlap)
+                    self.assertEqual(chunk_text_with_overlap(text[:length], max_length, overlap), expected)
+                    self.assertEqual(list(iter_chunks_with_overlap(text[:length], max_length, overlap)), expected)
+
+    def test_last_chunk_reaches_end(self):
+        """The final window ends exactly at the end of the text."""
+        chunks = chunk_text_with_overlap("x" * 1000 + "end", 300, 50)
+        self.assertTrue(chunks[-1].endswith("end"))
+        self.assertTrue(all(len(chunk) <= 300 for chunk in chunks))
+
+    def test_overlap_not_smaller_than_max_length(self):
+        """Long text with a non-advancing window raises instead of looping forever."""
+        with self.assertRaises(ValueError):
+            chunk_text_with_overlap("x" * 50, 10, 10)
+        with self.assertRaises(ValueError):
+            list(iter_chunks_with_overlap("x" * 50, 10, 20))
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
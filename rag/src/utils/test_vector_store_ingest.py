@@ -0,0 +1,96 @@
+"""
+Unit tests for re-ingesting papers into the vector store.
+"""
+import importlib.util
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+HAS_VECTOR_STORE_DEPS = all(
+    importlib.util.find_spec(name) is not None for name in ("chromadb", "sentence_transformers")
+)
+
+if HAS_VECTOR_STORE_DEPS:
+    import chromadb
+    from ..services import vector_store_service
+    from ..services.vector_store_service import VectorStoreService, SharedModelEmbeddingFunction
+
+class FakeModel:
+    """Deterministic stand-in for the SentenceTransformer model."""
+
+    def encode(self, texts, **kwargs):
+        return np.array([[float(len(text)), 1.0, float(i)] for i, text in enumerate(texts)])
+
+@unittest.skipUnless(HAS_VECTOR_STORE_DEPS, "chromadb and sentence_transformers are required")
+class TestReingest(unittest.TestCase):
+
+    PAPER = {"title": "Attention Is All You Need", "authors": ["Ashish Vaswani"], "year": 2017,
+             "arxiv_id": "1706.03762"}
+
+    def setUp(self):
+        self.service = VectorStoreService.__new__(VectorStoreService)
+        self.service.model = FakeModel()
+        self.service.embedding_model = SharedModelEmbeddingFunction(self.service.model)
+        self.service.client = chromadb.EphemeralClient()
+        for collection in self.service.client.list_collections():
+            self.service.client.delete_collection(getattr(collection, "name", collection))
+        self.service.fine_collection = self.service._get_or_create_collection("fine_test")
+        self.service.coarse_collection = self.service._get_or_create_collection("coarse_test")
+
+    def ingest(self, fine_chunks, coarse_chunks, paper=None):
+        with patch.object(vector_store_service, "create_fine_chunks", return_value=fine_chunks), \
+                patch.object(vector_store_service, "create_coarse_chunks", return_value=coarse_chunks):
+            return self.service.ingest_papers([("text", paper or self.PAPER)])
+
+    def stored_ids(self, collection):
+        return sorted(collection.get()["ids"])
+
+    def test_reingest_is_idempotent(self):
+        """Ingesting the same paper twice leaves one copy of each chunk."""
+        self.assertTrue(self.ingest(["f0", "f1", "f2"], ["c0", "c1"]))
+        self.assertTrue(self.ingest(["f0", "f1", "f2"], ["c0", "c1"]))
+        self.assertEqual(self.stored_ids(self.service.fine_collection),
+                         [f"1706.03762:fine:{i}" for i in range(3)])
+        self.assertEqual(self.stored_ids(self.service.coarse_collection),
+                         [f"1706.03762:coarse:{i}" for i in range(2)])
+
+    def test_reingest_with_fewer_chunks_drops_stale_ones(self):
+        """Chunks past the new count from an earlier ingest are deleted."""
+        self.assertTrue(self.ingest(["f0", "f1", "f2", "f3"], ["c0", "c1", "c2"]))
+        self.assertTrue(self.ingest(["g0", "g1"], ["d0"]))
+        fine = self.service.fine_collection.get()
+        self.assertEqual(sorted(fine["ids"]), ["1706.03762:fine:0", "1706.03762:fine:1"])
+        self.assertEqual(sorted(fine["documents"]), ["g0", "g1"])
+        self.assertEqual(self.stored_ids(self.service.coarse_collection), ["1706.03762:coarse:0"])
+
+    def test_duplicate_papers_in_one_batch(self):
+        """The same paper twice in one batch is ingested once, from the last copy."""
+        with patch.object(vector_store_service, "create_fine_chunks", side_effect=[["a0", "a1"], ["b0"]]), \
+                patch.object(vector_store_service, "create_coarse_chunks", return_value=["c0"]):
+            self.assertTrue(self.service.ingest_papers([("one", self.PAPER), ("two", self.PAPER)]))
+        fine = self.service.fine_collection.get()
+        self.assertEqual(fine["ids"], ["1706.03762:fine:0"])
+        self.assertEqual(fine["documents"], ["b0"])
+
+    def test_failed_upsert_keeps_previous_chunks(self):
+        """Stale chunks are only deleted after the new chunks are stored."""
+        self.assertTrue(self.ingest(["f0", "f1", "f2"], ["c0", "c1"]))
+        with patch.object(self.service, "add_texts_to_collection", return_value=False):
+            self.assertFalse(self.ingest(["g0"], ["d0"]))
+        self.assertEqual(self.stored_ids(self.service.fine_collection),
+                         [f"1706.03762:fine:{i}" for i in range(3)])
+        self.assertEqual(self.stored_ids(self.service.coarse_collection),
+                         [f"1706.03762:coarse:{i}" for i in range(2)])
+
+    def test_add_texts_uses_the_same_ids(self):
+        """Chunks added without explicit ids get the ids ingest_papers uses."""
+        self.assertTrue(self.ingest(["f0", "f1"], ["c0"]))
+        metadatas = self.service.fine_collection.get(ids=["1706.03762:fine:0"])["metadatas"]
+        self.assertTrue(self.service.add_texts_to_collection(["f0 again"], metadatas, "fine"))
+        fine = self.service.fine_collection.get()
+        self.assertEqual(sorted(fine["ids"]), ["1706.03762:fine:0", "1706.03762:fine:1"])
+        self.assertIn("f0 again", fine["documents"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,73 @@
 """
 Text processing utilities for the RAG server.
 """
+import os
 import re
 import logging
-from typing import List, Dict, Tuple, Optional
+import threading
+from collections import OrderedDict
+from hashlib import blake2b
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate, chain
+from typing import List, Dict, Iterable, Iterator, Tuple, Optional
 from dataclasses import dataclass
 
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 logger = logging.getLogger(__name__)
 
+# Pattern for arXiv IDs: 4 digits, dot, 4-5 digits
+_ARXIV_ID_RE = re.compile(r'(\d{4}\.\d{4,5})')
+
+# Number of (text, model) token counts kept by count_tokens
+TOKEN_COUNT_CACHE_SIZE = 100_000
+# Texts longer than this are cached by digest so the cache doesn't pin whole chunks
+TOKEN_COUNT_DIGEST_MIN_CHARS = 2048
+LONG_TOKEN_COUNT_CACHE_SIZE = 4096
+_long_token_counts: "OrderedDict[Tuple[bytes, str], int]" = OrderedDict()
+_long_token_counts_lock = threading.Lock()
+
+# Number of cleaned documents kept by preprocess_text, keyed by content digest
+PREPROCESS_CACHE_SIZE = 64
+_preprocess_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_preprocess_cache_lock = threading.Lock()
+
+# preprocess_text patterns
+_SPACES_RE = re.compile(r' +')
+# Blank-line runs (which start with a newline) and space runs in one scan
+_WHITESPACE_RUNS_RE = re.compile(r'\n\s*\n\s*\n+| +')
+# Matched against a whole stripped line
+_BOILERPLATE_HEADER_RE = re.compile(
+    r'(?:Abstract|Introduction|Conclusion|References|Bibliography)', re.IGNORECASE
+)
+_ARXIV_URL_RE = re.compile(r'https?://arxiv\.org/abs/\d+\.\d+')
+_FRAGMENTED_LETTERS_RE = re.compile(r'^\s*[a-zA-Z]\s*\n\s*[a-zA-Z]\s*\n\s*[a-zA-Z]', re.MULTILINE | re.DOTALL)
+_BROKEN_MATH_RE = re.compile(r'([A-Za-z])\s*\n\s*([+\-*/=])')
+_REPEATED_PUNCTUATION_RE = re.compile(r'[.!?]{3,}')
+_ISOLATED_CHAR_RE = re.compile(r'\b[a-zA-Z]\b')
+_PUNCTUATION_TABLE = str.maketrans({
+    '\u201c': '"', '\u201d': '"',  # Smart double quotes
+    '\u2018': "'", '\u2019': "'",  # Smart single quotes
+    '\u2013': '-', '\u2014': '-',  # En/em dashes
+})
+
+# Sentence boundaries for fine chunks: terminal punctuation and the whitespace after it
+_SENTENCE_END_RE = re.compile(r'[.!?]\s+')
+
+# Semantic break patterns
+_EQUATION_CHAR_RE = re.compile(r'[=+\-*/\\]')
+# Bullet points, numbered lists, figure/table references and citations in one scan
+_STRUCTURAL_BREAK_RE = re.compile(
+    r'^[\s]*(?:[•\-\*]|\d+\.)\s'
+    r'|(?:Figure|Table)\s+\d+'
+    r'|\[[\d,\s]+\]',
+    re.IGNORECASE
+)
+
 @dataclass
 class ChunkingConfig:
     """Configuration for advanced chunking algorithm."""
@@ -24,6 +84,42 @@ class ChunkingConfig:
                 'methods', 'experiments', 'results', 'discussion', 
                 'conclusion', 'references', 'bibliography', 'appendix'
             ]
+        # Header matchers used for every line of split_into_sections
+        self._section_header_set = _header_set(tuple(self.section_headers))
+        self._section_header_pattern = _numbered_header_pattern(tuple(self.section_headers))
+
+def _isolated_chars_per_line(text: str, lines: List[str]) -> List[int]:
+    """Count isolated letters on each line with one scan over the whole text."""
+    counts = [0] * len(lines)
+    if not _ISOLATED_CHAR_RE.search(text):
+        return counts
+    # Offset just past each line's trailing newline
+    line_ends = list(accumulate(len(line) + 1 for line in lines))
+    for match in _ISOLATED_CHAR_RE.finditer(text):
+        counts[bisect_right(line_ends, match.start())] += 1
+    return counts
+
+def _is_artifact_line(stripped: str) -> bool:
+    """
+    Whether a stripped line is a PDF artifact to drop.
+    
+    Artifacts are page and standalone numbers, ALL CAPS headers and footers
+    (ASCII capitals only), fragmented lines of one to three letters, and
+    boilerplate headings.
+    """
+    if stripped.isdecimal() or (stripped.startswith('Page ') and stripped[5:].isdecimal()):
+        return True
+    # Only all-caps lines and lines of at most three words can be letter-only artifacts
+    if stripped.isupper() or len(stripped.split(None, 3)) <= 3:
+        letters = ''.join(stripped.split())
+        if letters.isascii() and letters.isalpha() and (letters.isupper() or len(letters) <= 3):
+            return True
+    # 'Abstract' is the shortest heading, 'Introduction'/'Bibliography' the longest
+    return 8 <= len(stripped) <= 12 and _BOILERPLATE_HEADER_RE.fullmatch(stripped) is not None
+
+def _collapse_whitespace_run(match: "re.Match") -> str:
+    """Replacement for _WHITESPACE_RUNS_RE: blank-line runs to one blank line, space runs to one space."""
+    return '\n\n' if match.group(0)[0] == '\n' else ' '
 
 def preprocess_text(text: str) -> str:
     """
@@ -38,67 +134,109 @@ def preprocess_text(text: str) -> str:
     if not text:
         return ""
     
+    # The same document is chunked for both the fine and coarse collections
+    key = blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    with _preprocess_cache_lock:
+        cached = _preprocess_cache.get(key)
+        if cached is not None:
+            _preprocess_cache.move_to_end(key)
+            return cached
+    
+    cleaned = _preprocess_text_uncached(text)
+    with _preprocess_cache_lock:
+        _preprocess_cache[key] = cleaned
+        while len(_preprocess_cache) > PREPROCESS_CACHE_SIZE:
+            _preprocess_cache.popitem(last=False)
+    return cleaned
+
+def _preprocess_text_uncached(text: str) -> str:
+    """Run the preprocess_text cleanup pipeline on non-empty text."""
     # Remove excessive whitespace and normalize line breaks
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Multiple line breaks to double
-    text = re.sub(r' +', ' ', text)  # Multiple spaces to single
-    
-    # Remove common PDF artifacts
-    text = re.sub(r'^\s*Page \d+\s*$', '', text, flags=re.MULTILINE)  # Page numbers
-    text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)  # Standalone numbers
-    
-    # Remove headers and footers that appear on every page
-    text = re.sub(r'^\s*[A-Z\s]{3,}\s*$', '', text, flags=re.MULTILINE)  # ALL CAPS headers
+    text = _WHITESPACE_RUNS_RE.sub(_collapse_whitespace_run, text)
     
-    # Remove common non-content lines
-    text = re.sub(r'^\s*(Abstract|Introduction|Conclusion|References|Bibliography)\s*$', '', text, flags=re.MULTILINE | re.IGNORECASE)
-    
-    # Remove fragmented single-character lines
-    text = re.sub(r'^\s*[a-zA-Z]\s*$', '', text, flags=re.MULTILINE)  # Single letters
-    text = re.sub(r'^\s*[a-zA-Z]\s*[a-zA-Z]\s*$', '', text, flags=re.MULTILINE)  # Two letters
-    text = re.sub(r'^\s*[a-zA-Z]\s*[a-zA-Z]\s*[a-zA-Z]\s*$', '', text, flags=re.MULTILINE)  # Three letters
+    # Remove common PDF artifacts: page numbers, ALL CAPS headers and footers,
+    # boilerplate headings and fragmented letters, checked line by line in one pass
+    text = '\n'.join(['' if _is_artifact_line(line.strip()) else line for line in text.split('\n')])
     
     # Remove arXiv identifiers and URLs
-    text = re.sub(r'https?://arxiv\.org/abs/\d+\.\d+', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\d{4}\.\d{4,5}', '', text, flags=re.MULTILINE)
+    text, url_count = _ARXIV_URL_RE.subn('', text)
+    text, id_count = _ARXIV_ID_RE.subn('', text)
     
     # Remove fragmented content patterns
-    text = re.sub(r'^\s*[a-zA-Z]\s*\n\s*[a-zA-Z]\s*\n\s*[a-zA-Z]', '', text, flags=re.MULTILINE | re.DOTALL)
+    text = _FRAGMENTED_LETTERS_RE.sub('', text)
     
     # Clean up mathematical expressions that might be broken across lines
-    text = re.sub(r'([A-Za-z])\s*\n\s*([+\-*/=])', r'\1\2', text)  # Fix broken math expressions
+    text = _BROKEN_MATH_RE.sub(r'\1\2', text)  # Fix broken math expressions
     
     # Remove excessive punctuation
-    text = re.sub(r'[.!?]{3,}', '...', text)  # Multiple punctuation to ellipsis
+    text = _REPEATED_PUNCTUATION_RE.sub('...', text)  # Multiple punctuation to ellipsis
     
-    # Normalize quotes and dashes
-    text = text.replace('"', '"').replace('"', '"')  # Smart quotes to regular
-    text = text.replace('–', '-').replace('—', '-')  # Em/en dashes to regular
+    # Normalize smart quotes and em/en dashes in a single pass
+    text = text.translate(_PUNCTUATION_TABLE)
     
     # Remove lines with too many isolated characters
     lines = text.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        words = line.split()
-        isolated_chars = len(re.findall(r'\b[a-zA-Z]\b', line))
-        if len(words) > 0 and isolated_chars <= len(words) * 0.4:
-            cleaned_lines.append(line)
-        elif len(words) == 0:
-            continue  # Skip empty lines
-        elif isolated_chars <= 2:  # Allow a few isolated chars
-            cleaned_lines.append(line)
-    
-    text = '\n'.join(cleaned_lines)
-    
-    # Final cleanup: remove excessive whitespace
-    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)  # Multiple line breaks to double
-    text = re.sub(r' +', ' ', text)  # Multiple spaces to single
+    isolated_counts = _isolated_chars_per_line(text, lines)
+    # Skip blank lines; allow a few isolated chars, or more on longer lines.
+    # Only lines with several isolated chars need their words counted.
+    text = '\n'.join([
+        line for line, isolated_chars in zip(lines, isolated_counts)
+        if line and not line.isspace()
+        and (isolated_chars <= 2 or isolated_chars <= len(line.split()) * 0.4)
+    ])
+    
+    # Final cleanup: blank lines are already gone, and only the mid-line arXiv
+    # removals can leave a run of spaces behind
+    if url_count or id_count:
+        text = _SPACES_RE.sub(' ', text)  # Multiple spaces to single
     
     return text.strip()
 
+# Tokenizer models warmed at startup so the first count_tokens call doesn't pay for loading
+_PRELOAD_TOKENIZER_MODELS = ("gpt-3.5-turbo", "gpt-4")
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """
+    Load the tiktoken encoding for a model once.
+    
+    Returns None (cached, so the warning is logged once per model) when tiktoken
+    is not installed or doesn't know the model.
+    """
+    if tiktoken is None:
+        logger.warning("tiktoken not available, using word-based token counting")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.warning(f"tiktoken has no encoding for model {model}, using word-based token counting")
+        return None
+
+def _preload_encodings():
+    for model in _PRELOAD_TOKENIZER_MODELS:
+        try:
+            _get_encoding(model)
+        except Exception as e:
+            logger.debug(f"Could not preload tiktoken encoding for {model}: {e}")
+
+def preload_tokenizers():
+    """
+    Warm the tiktoken encodings in a background thread.
+    
+    Called from the app startup hook rather than at import. Loading may read
+    or download the BPE files, which are kept on disk between processes unless
+    TIKTOKEN_CACHE_DIR is already set.
+    """
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.expanduser("~/.cache/tiktoken"))
+    threading.Thread(target=_preload_encodings, name="tiktoken-preload", daemon=True).start()
+
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """
     Count tokens in text using tiktoken (OpenAI's tokenizer).
     
+    Results are cached, since chunking counts the same paragraphs and
+    chunks repeatedly.
+    
     Args:
         text: Text to count tokens for
         model: Model name for tokenizer (default: gpt-3.5-turbo)
@@ -106,40 +244,81 @@ def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     Returns:
         Token count
     """
-    try:
-        import tiktoken
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except (ImportError, KeyError):
+    if len(text) <= TOKEN_COUNT_DIGEST_MIN_CHARS:
+        return _count_tokens_cached(text, model)
+    
+    key = (blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest(), model)
+    with _long_token_counts_lock:
+        cached = _long_token_counts.get(key)
+        if cached is not None:
+            _long_token_counts.move_to_end(key)
+            return cached
+    
+    count = _count_tokens_uncached(text, model)
+    with _long_token_counts_lock:
+        _long_token_counts[key] = count
+        while len(_long_token_counts) > LONG_TOKEN_COUNT_CACHE_SIZE:
+            _long_token_counts.popitem(last=False)
+    return count
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def _count_tokens_cached(text: str, model: str) -> int:
+    return _count_tokens_uncached(text, model)
+
+def _count_tokens_uncached(text: str, model: str) -> int:
+    encoding = _get_encoding(model)
+    if encoding is None:
         # Fallback to simple word-based counting if tiktoken fails
-        logger.warning("tiktoken not available or model not found, using word-based token counting")
         return len(text.split())
+    return len(encoding.encode_ordinary(text))
 
-def is_section_header(text: str, section_headers: List[str]) -> bool:
+def count_tokens_batch(texts: List[str], model: str = "gpt-3.5-turbo") -> List[int]:
     """
-    Check if text is a section header.
+    Count tokens for many texts with a single batched tokenizer call.
     
     Args:
-        text: Text to check
-        section_headers: List of section header keywords
+        texts: Texts to count tokens for
+        model: Model name for tokenizer (default: gpt-3.5-turbo)
         
     Returns:
-        True if text appears to be a section header
+        Token count for each text, in order
     """
-    text_stripped = text.strip()
+    if not texts:
+        return []
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return [count_tokens(text, model) for text in texts]
+    # encode_ordinary_batch releases the GIL and tokenizes on several threads
+    return [len(tokens) for tokens in encoding.encode_ordinary_batch(texts, num_threads=os.cpu_count() or 1)]
+
+@lru_cache(maxsize=8)
+def _header_set(section_headers: Tuple[str, ...]) -> frozenset:
+    """Lowercased headers for O(1) exact matching, built once per header list."""
+    return frozenset(header.lower() for header in section_headers)
+
+@lru_cache(maxsize=8)
+def _numbered_header_pattern(section_headers: Tuple[str, ...]) -> Optional["re.Pattern"]:
+    """Compile one alternation matching any numbered header, once per header list."""
+    if not section_headers:
+        return None
+    # Lowercase the headers and allow any separator between their words
+    alternatives = '|'.join(
+        r'\W+'.join(map(re.escape, header.lower().split())) for header in section_headers
+    )
+    return re.compile(r'^\s*\d+\W*(?:' + alternatives + r')(\s|$)', re.IGNORECASE)
+
+def _matches_section_header(text_stripped: str, header_set: frozenset,
+                            header_pattern: Optional["re.Pattern"]) -> bool:
+    """Section header check for an already-stripped line with prebuilt matchers."""
     text_lower = text_stripped.lower()
     
     # Match exact section header (case-insensitive)
-    if text_lower in section_headers:
+    if text_lower in header_set:
         return True
     
     # Match numbered section headers (e.g., '1. Introduction', '2. Related Work')
-    for header in section_headers:
-        # Lowercase the header for matching
-        header_words = header.lower().split()
-        pattern = r'^\s*\d+\W*' + r'\W+'.join(map(re.escape, header_words)) + r'(\s|$)'
-        if re.match(pattern, text_lower, re.IGNORECASE):
-            return True
+    if header_pattern is not None and header_pattern.match(text_lower):
+        return True
     
     # Check for all caps headers
     if text_stripped.isupper() and len(text_stripped.split()) <= 5:
@@ -147,6 +326,21 @@ def is_section_header(text: str, section_headers: List[str]) -> bool:
     
     return False
 
+def is_section_header(text: str, section_headers: List[str]) -> bool:
+    """
+    Check if text is a section header.
+    
+    Args:
+        text: Text to check
+        section_headers: List of section header keywords
+        
+    Returns:
+        True if text appears to be a section header
+    """
+    headers_key = tuple(section_headers)
+    return _matches_section_header(text.strip(), _header_set(headers_key),
+                                   _numbered_header_pattern(headers_key))
+
 def is_semantic_break(text: str) -> bool:
     """
     Check if text represents a semantic break that shouldn't be split.
@@ -157,23 +351,21 @@ def is_semantic_break(text: str) -> bool:
     Returns:
         True if this represents a semantic break
     """
-    # Check for equations (simplified)
-    if re.search(r'[=+\-*/\\]', text) and len(text.strip()) < 50:
-        return True
-    
-    # Check for bullet points or numbered lists
-    if re.match(r'^[\s]*[•\-\*]\s', text) or re.match(r'^[\s]*\d+\.\s', text):
-        return True
+    stripped = text.strip()
     
-    # Check for figure/table references
-    if re.search(r'(Figure|Table)\s+\d+', text, re.IGNORECASE):
+    # Check for equations (simplified); the length test is cheaper than the search
+    if len(stripped) < 50 and _EQUATION_CHAR_RE.search(text):
         return True
     
-    # Check for citations
-    if re.search(r'\[[\d,\s]+\]', text):
-        return True
+    # Fast reject: every structural break needs a leading bullet or digit, a '['
+    # or a figure/table mention ('gure' because IGNORECASE also matches dotless i)
+    lowered = text.lower()
+    if not (stripped.startswith(('•', '-', '*')) or stripped[:1].isdecimal()
+            or '[' in text or 'gure' in lowered or 'table' in lowered):
+        return False
     
-    return False
+    # Check for bullet points, numbered lists, figure/table references and citations
+    return _STRUCTURAL_BREAK_RE.search(text) is not None
 
 def split_into_sections(text: str, section_headers: List[str]) -> List[Tuple[str, str]]:
     """
@@ -186,21 +378,27 @@ def split_into_sections(text: str, section_headers: List[str]) -> List[Tuple[str
     Returns:
         List of (section_name, section_content) tuples
     """
-    lines = text.split('\n')
-    sections = []
+    headers_key = tuple(section_headers)
+    return list(_iter_sections(text, _header_set(headers_key), _numbered_header_pattern(headers_key)))
+
+def _iter_sections(text: str, header_set: frozenset,
+                   header_pattern: Optional["re.Pattern"]) -> Iterator[Tuple[str, str]]:
+    """Yield (section_name, section_content) pairs using header matchers built once by the caller."""
     current_section = "Unknown"
     current_content = []
+    found_section = False
     
-    for line in lines:
+    for line in text.split('\n'):
         line = line.strip()
         if not line:
             continue
             
         # Check if this line is a section header
-        if is_section_header(line, section_headers):
-            # Save previous section
+        if _matches_section_header(line, header_set, header_pattern):
+            # Emit previous section
             if current_content:
-                sections.append((current_section, '\n'.join(current_content)))
+                found_section = True
+                yield current_section, '\n'.join(current_content)
             
             # Start new section
             current_section = line
@@ -208,15 +406,14 @@ def split_into_sections(text: str, section_headers: List[str]) -> List[Tuple[str
         else:
             current_content.append(line)
     
-    # Add the last section
+    # Emit the last section
     if current_content:
-        sections.append((current_section, '\n'.join(current_content)))
+        found_section = True
+        yield current_section, '\n'.join(current_content)
     
     # If no sections were found, treat the entire text as one section
-    if not sections:
-        sections.append(("Content", text.strip()))
-    
-    return sections
+    if not found_section:
+        yield "Content", text.strip()
 
 def split_into_paragraphs(text: str) -> List[str]:
     """
@@ -228,15 +425,44 @@ def split_into_paragraphs(text: str) -> List[str]:
     Returns:
         List of paragraphs
     """
-    # Split by double newlines (paragraph breaks)
-    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+    # Split by double newlines (paragraph breaks), stripping each piece once
+    paragraphs = [stripped for p in text.split('\n\n') if (stripped := p.strip())]
     
     # If no double newlines, try single newlines
     if not paragraphs:
-        paragraphs = [p.strip() for p in text.split('\n') if p.strip()]
+        paragraphs = [stripped for p in text.split('\n') if (stripped := p.strip())]
     
     return paragraphs
 
+def _merge_boundaries(token_counts: List[int], has_text: List[bool], max_tokens: int) -> List[int]:
+    """
+    Greedily group paragraphs so each group stays within max_tokens.
+    
+    A paragraph that would push a non-empty group over the limit starts a new group.
+    
+    Args:
+        token_counts: Token count of each paragraph
+        has_text: Whether each paragraph is non-empty
+        max_tokens: Token budget per group
+        
+    Returns:
+        Index of the first paragraph of each group
+    """
+    starts = [0]
+    current_tokens = 0
+    current_has_text = False
+    
+    for i, paragraph_tokens in enumerate(token_counts):
+        if current_tokens + paragraph_tokens > max_tokens and current_has_text:
+            starts.append(i)
+            current_tokens = paragraph_tokens
+            current_has_text = has_text[i]
+        else:
+            current_tokens += paragraph_tokens
+            current_has_text = current_has_text or has_text[i]
+    
+    return starts
+
 def merge_paragraphs_semantically(paragraphs: List[str], config: ChunkingConfig) -> List[str]:
     """
     Recursively merge paragraphs while preserving semantic boundaries.
@@ -251,35 +477,25 @@ def merge_paragraphs_semantically(paragraphs: List[str], config: ChunkingConfig)
     if not paragraphs:
         return []
     
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
+    # Tokenize every paragraph up front in one batch
+    paragraph_token_counts = count_tokens_batch(paragraphs, config.tokenizer_model)
     
-    for i, paragraph in enumerate(paragraphs):
-        paragraph_tokens = count_tokens(paragraph, config.tokenizer_model)
-        
-        # Check if adding this paragraph would exceed max_tokens
-        if current_tokens + paragraph_tokens > config.max_tokens and current_chunk:
-            # Current chunk is ready
-            chunks.append(current_chunk.strip())
-            current_chunk = paragraph
-            current_tokens = paragraph_tokens
-        else:
-            # Add to current chunk
-            if current_chunk:
-                current_chunk += "\n\n" + paragraph
-            else:
-                current_chunk = paragraph
-            current_tokens += paragraph_tokens
+    # Decide chunk boundaries on the integer counts, then build each chunk once
+    starts = _merge_boundaries(paragraph_token_counts, [bool(p) for p in paragraphs], config.max_tokens)
+    ends = starts[1:] + [len(paragraphs)]
+    chunks = [
+        "\n\n".join(paragraphs[start:end]).strip()
+        for start, end in zip(starts, ends)
+    ]
     
-    # Add the last chunk if it exists
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+    # Drop the last chunk if it is empty
+    if not chunks[-1]:
+        chunks.pop()
     
     # Post-process: ensure minimum token count
     final_chunks = []
-    for chunk in chunks:
-        chunk_tokens = count_tokens(chunk, config.tokenizer_model)
+    chunk_token_counts = count_tokens_batch(chunks, config.tokenizer_model)
+    for chunk, chunk_tokens in zip(chunks, chunk_token_counts):
         if chunk_tokens >= config.min_tokens:
             final_chunks.append(chunk)
         elif final_chunks:
@@ -302,26 +518,20 @@ def apply_overlap_sliding_window(chunks: List[str], config: ChunkingConfig) -> L
     if not chunks or config.overlap_tokens <= 0:
         return chunks
     
-    overlapped_chunks = []
-    
-    for i, chunk in enumerate(chunks):
-        if i == 0:
-            # First chunk: no overlap
-            overlapped_chunks.append(chunk)
-        else:
-            # Add overlap from previous chunk
-            prev_chunk = chunks[i-1]
-            prev_words = prev_chunk.split()
-            
-            # Calculate overlap words
-            overlap_words = max(0, len(prev_words) - config.overlap_tokens)
-            overlap_text = ' '.join(prev_words[overlap_words:])
-            
-            # Create overlapped chunk
-            overlapped_chunk = overlap_text + "\n\n" + chunk
-            overlapped_chunks.append(overlapped_chunk)
+    return list(_iter_overlapped(chunks, config.overlap_tokens))
+
+def _iter_overlapped(chunks: Iterable[str], overlap_words: int) -> Iterator[str]:
+    """
+    Yield chunks prefixed with the tail of the previous chunk.
     
-    return overlapped_chunks
+    Only the previous chunk's last overlap_words words are kept between steps.
+    The overlap is measured in whitespace-separated words, not tokenizer tokens.
+    """
+    prev_tail = None
+    for chunk in chunks:
+        # First chunk: no overlap
+        yield chunk if prev_tail is None else prev_tail + "\n\n" + chunk
+        prev_tail = ' '.join(chunk.rsplit(None, overlap_words)[-overlap_words:])
 
 def advanced_chunk_by_structure(text: str, config: Optional[ChunkingConfig] = None) -> List[str]:
     """
@@ -340,13 +550,47 @@ def advanced_chunk_by_structure(text: str, config: Optional[ChunkingConfig] = No
     if config is None:
         config = ChunkingConfig()
     
+    return list(iter_chunks_by_structure(text, config))
+
+def iter_chunks_by_structure(text: str, config: Optional[ChunkingConfig] = None) -> Iterator[str]:
+    """
+    Lazily yield the same chunks as advanced_chunk_by_structure, one section at a time.
+    
+    Args:
+        text: Text to chunk
+        config: Chunking configuration (uses defaults if None)
+        
+    Yields:
+        Text chunks
+    """
+    if not text:
+        return
+    
+    if config is None:
+        config = ChunkingConfig()
+    
     # Step 1: Preprocess text
     text = preprocess_text(text)
     
-    # Step 2: Split into sections
-    sections = split_into_sections(text, config.section_headers)
+    # Steps 2-5: sectioned chunks, or paragraph-based chunks if sections yield none
+    chunks = _iter_section_chunks(text, config)
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        paragraphs = split_into_paragraphs(text)
+        chunks = iter(merge_paragraphs_semantically(paragraphs, config) if paragraphs else [])
+    else:
+        chunks = chain([first_chunk], chunks)
+    
+    # Step 6: Apply sliding window overlap if configured
+    if config.overlap_tokens > 0:
+        chunks = _iter_overlapped(chunks, config.overlap_tokens)
     
-    all_chunks = []
+    yield from chunks
+
+def _iter_section_chunks(text: str, config: ChunkingConfig) -> Iterator[str]:
+    """Yield merged chunks section by section, prefixed with their section name."""
+    # Step 2: Split into sections
+    sections = _iter_sections(text, config._section_header_set, config._section_header_pattern)
     
     for section_name, section_content in sections:
         if not section_content.strip():
@@ -362,23 +606,21 @@ def advanced_chunk_by_structure(text: str, config: Optional[ChunkingConfig] = No
         section_chunks = merge_paragraphs_semantically(paragraphs, config)
         
         # Step 5: Add section metadata to chunks
+        section_lower = section_name.lower()
         for chunk in section_chunks:
             # Add section header as prefix if chunk doesn't start with it
-            if not chunk.lower().startswith(section_name.lower()):
+            if not chunk.lower().startswith(section_lower):
                 chunk = f"[{section_name}]\n\n{chunk}"
-            all_chunks.append(chunk)
-    
-    # If no chunks were created through section-based chunking, fall back to paragraph-based
-    if not all_chunks:
-        paragraphs = split_into_paragraphs(text)
-        if paragraphs:
-            all_chunks = merge_paragraphs_semantically(paragraphs, config)
-    
-    # Step 6: Apply sliding window overlap if configured
-    if config.overlap_tokens > 0 and all_chunks:
-        all_chunks = apply_overlap_sliding_window(all_chunks, config)
-    
-    return all_chunks
+            yield chunk
+
+def _overlap_chunk_starts(text_length: int, max_length: int, overlap: int) -> range:
+    """Start offsets of the overlapping windows covering a text longer than max_length."""
+    step = max_length - overlap
+    if step <= 0:
+        raise ValueError("overlap must be smaller than max_length")
+    # One window, plus however many further steps it takes for a window to reach the end
+    n_chunks = 1 + max(0, -(-(text_length - max_length) // step))
+    return range(0, n_chunks * step, step)
 
 def chunk_text_with_overlap(text: str, max_length: int = 1500, overlap: int = 200) -> List[str]:
     """
@@ -394,21 +636,32 @@ def chunk_text_with_overlap(text: str, max_length: int = 1500, overlap: int = 20
     """
     if not text:
         return []
+    if len(text) <= max_length:
+        return [text]
     
-    chunks = []
-    start = 0
-    text_length = len(text)
-    
-    while start < text_length:
-        end = min(start + max_length, text_length)
-        chunk = text[start:end]
-        chunks.append(chunk)
-        if end == text_length:
-            break
-        start = end - overlap  # move back by overlap for next chunk
-        if start < 0:
-            start = 0
-    return chunks
+    return [text[start:start + max_length]
+            for start in _overlap_chunk_starts(len(text), max_length, overlap)]
+
+def iter_chunks_with_overlap(text: str, max_length: int = 1500, overlap: int = 200) -> Iterator[str]:
+    """
+    Lazily yield the same overlapping chunks as chunk_text_with_overlap.
+    
+    Args:
+        text: The input text to chunk.
+        max_length: Maximum number of characters per chunk.
+        overlap: Number of characters to overlap between consecutive chunks.
+    
+    Yields:
+        Text chunks, each sliced only when requested.
+    """
+    if not text:
+        return
+    if len(text) <= max_length:
+        yield text
+        return
+    
+    for start in _overlap_chunk_starts(len(text), max_length, overlap):
+        yield text[start:start + max_length]
 
 def chunk_by_paragraphs(text: str, max_chars: int = 1500) -> List[str]:
     """
@@ -426,26 +679,27 @@ def chunk_by_paragraphs(text: str, max_chars: int = 1500) -> List[str]:
     
     paragraphs = text.split("\n\n")
     chunks = []
-    current = ""
+    # Paragraphs of the chunk being built and its joined length
+    current_parts = []
+    current_len = 0
     
     for p in paragraphs:
         p = p.strip()
         if not p:  # Skip empty paragraphs
             continue
             
-        if len(current) + len(p) < max_chars:
-            if current:
-                current += "\n\n" + p
-            else:
-                current = p
+        if current_len + len(p) < max_chars:
+            current_len += len(p) + 2 if current_parts else len(p)
+            current_parts.append(p)
         else:
-            if current.strip():  # Just check if not empty
-                chunks.append(current.strip())
-            current = p
+            if current_parts:
+                chunks.append("\n\n".join(current_parts))
+            current_parts = [p]
+            current_len = len(p)
     
     # Add the last chunk if it exists
-    if current.strip():
-        chunks.append(current.strip())
+    if current_parts:
+        chunks.append("\n\n".join(current_parts))
     
     return chunks
 
@@ -459,11 +713,20 @@ def extract_arxiv_id(input_str: str) -> str:
     Returns:
         Extracted arXiv ID or empty string
     """
-    # Pattern for arXiv IDs: 4 digits, dot, 4-5 digits
-    pattern = r'(\d{4}\.\d{4,5})'
-    match = re.search(pattern, input_str)
+    match = _ARXIV_ID_RE.search(input_str)
     return match.group(1) if match else ""
 
+def _split_sentences(text: str) -> List[str]:
+    """Split text after each '.', '!' or '?' followed by whitespace, dropping empty pieces."""
+    pieces = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        # Keep the punctuation, drop the whitespace run
+        pieces.append(text[start:match.start() + 1])
+        start = match.end()
+    pieces.append(text[start:])
+    return [stripped for piece in pieces if (stripped := piece.strip())]
+
 def create_fine_chunks(text: str, min_chars: int = 300, max_chars: int = 500, 
                       min_sentences: int = 1, max_sentences: int = 3) -> List[str]:
     """
@@ -483,43 +746,43 @@ def create_fine_chunks(text: str, min_chars: int = 300, max_chars: int = 500,
         return []
     
     # Split text into sentences
-    sentences = re.split(r'(?<=[.!?])\s+', text)
-    sentences = [s.strip() for s in sentences if s.strip()]
+    sentences = _split_sentences(text)
     
     if not sentences:
         return []
     
     chunks = []
-    current_chunk = ""
-    current_sentences = 0
+    # Sentences of the chunk being built and its joined length
+    current_sentences = []
+    current_len = 0
     
     for sentence in sentences:
-        # Check if adding this sentence would exceed limits
-        potential_chunk = current_chunk + " " + sentence if current_chunk else sentence
+        # Length of the chunk if this sentence were added
+        potential_len = current_len + 1 + len(sentence) if current_sentences else len(sentence)
         
         # Check character limits
-        if len(potential_chunk) > max_chars and current_chunk:
+        if potential_len > max_chars and current_sentences:
             # Current chunk is ready
-            if len(current_chunk) >= min_chars and current_sentences >= min_sentences:
-                chunks.append(current_chunk.strip())
-            current_chunk = sentence
-            current_sentences = 1
+            if current_len >= min_chars and len(current_sentences) >= min_sentences:
+                chunks.append(" ".join(current_sentences))
+            current_sentences = [sentence]
+            current_len = len(sentence)
         else:
             # Check sentence limits
-            if current_sentences >= max_sentences and current_chunk:
+            if len(current_sentences) >= max_sentences and current_sentences:
                 # Current chunk is ready
-                if len(current_chunk) >= min_chars:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence
-                current_sentences = 1
+                if current_len >= min_chars:
+                    chunks.append(" ".join(current_sentences))
+                current_sentences = [sentence]
+                current_len = len(sentence)
             else:
                 # Add to current chunk
-                current_chunk = potential_chunk
-                current_sentences += 1
+                current_sentences.append(sentence)
+                current_len = potential_len
     
     # Add the last chunk if it meets minimum requirements
-    if current_chunk and len(current_chunk) >= min_chars and current_sentences >= min_sentences:
-        chunks.append(current_chunk.strip())
+    if current_sentences and current_len >= min_chars and len(current_sentences) >= min_sentences:
+        chunks.append(" ".join(current_sentences))
     
     return chunks
 
@@ -552,15 +815,19 @@ def create_coarse_chunks(text: str, min_chars: int = 1000, max_chars: int = 1500
     # Get chunks using advanced chunking
     chunks = advanced_chunk_by_structure(text, config)
     
+    # Only chunks inside the character window need an exact token count;
+    # count those in one batch
+    in_window = [chunk for chunk in chunks if min_chars <= len(chunk) <= max_chars]
+    window_tokens = iter(count_tokens_batch(in_window, config.tokenizer_model))
+    
     # Post-process to ensure character limits
     final_chunks = []
     for chunk in chunks:
         chunk_chars = len(chunk)
-        chunk_tokens = count_tokens(chunk, config.tokenizer_model)
         
         # Check if chunk meets requirements
-        if (chunk_chars >= min_chars and chunk_chars <= max_chars and 
-            chunk_tokens >= min_tokens and chunk_tokens <= max_tokens):
+        if (min_chars <= chunk_chars <= max_chars and
+            min_tokens <= next(window_tokens) <= max_tokens):
             final_chunks.append(chunk)
         elif chunk_chars > max_chars:
             # Split oversized chunks